@@ -0,0 +1,404 @@
+"""Local HTTP API for map statistics.
+
+Serves JSON aggregates straight from the SQLite database using
+pooled read-only connections. Results of hot queries are kept
+in an in-memory TTL cache.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import json
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+import db
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_CACHE_TTL = 60.0
+DEFAULT_DAYS = 30
+MAX_DAYS = 100 * 365
+MAX_INT_PARAM = 1000000
+MAX_REQUEST_HEAD_SIZE = 16 * 1024
+
+# Plain comparison of ISO 8601 strings so that the
+# match_datetime index can be used.
+_WHERE_WINDOW = """
+    m.match_datetime >= ?
+    AND m.players >= ?
+"""
+
+# noinspection SqlNoDataSourceInspection
+SQL_WIN_RATES = f"""
+SELECT
+    m.name AS name,
+    COUNT(*) AS games_played,
+    SUM(m.winning_team = 'Axis') AS axis_wins,
+    SUM(m.winning_team = 'Allies') AS allies_wins
+FROM {db.MAP_STATS_TABLE} m
+WHERE {_WHERE_WINDOW}
+GROUP BY m.name
+ORDER BY games_played DESC, m.name
+"""
+
+# noinspection SqlNoDataSourceInspection
+SQL_WIN_CONDITIONS = f"""
+SELECT
+    m.name AS name,
+    m.winning_team AS winning_team,
+    m.win_condition AS win_condition,
+    COUNT(*) AS count
+FROM {db.MAP_STATS_TABLE} m
+WHERE {_WHERE_WINDOW}
+GROUP BY m.name, m.winning_team, m.win_condition
+ORDER BY m.name, count DESC
+"""
+
+# noinspection SqlNoDataSourceInspection
+SQL_HOTTEST_OBJECTIVES = f"""
+SELECT name, obj_name, count FROM (
+    SELECT
+        o.map_name AS name,
+        o.obj_name AS obj_name,
+        COUNT(*) AS count,
+        ROW_NUMBER() OVER (
+            PARTITION BY o.map_name ORDER BY COUNT(*) DESC, o.obj_name
+        ) AS rank
+    FROM {db.MAP_END_OBJECTIVES_TABLE} o
+    JOIN {db.MAP_STATS_TABLE} m
+        ON m.match_datetime = o.match_datetime
+        AND m.server_id = o.server_id
+        AND m.name = o.map_name
+    WHERE {_WHERE_WINDOW}
+    AND m.win_condition != 'ROWC_AllObjectiveCaptured'
+    AND o.obj_index IS NOT NULL
+    GROUP BY o.map_name, o.obj_name
+)
+WHERE rank <= ?
+ORDER BY name, count DESC
+"""
+
+# Seconds are truncated so that pandas can parse all values
+# with the same format.
+# noinspection SqlNoDataSourceInspection
+SQL_DAILY = f"""
+SELECT
+    m.name AS name,
+    DATETIME(m.match_datetime) AS match_datetime,
+    m.winning_team AS winning_team,
+    m.time_remaining AS time_remaining
+FROM {db.MAP_STATS_TABLE} m
+WHERE {_WHERE_WINDOW}
+"""
+
+
+class BadRequest(Exception):
+    pass
+
+
+class TTLCache:
+    """Minimal time-to-live cache. Only used from the event loop thread."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._items: Dict[Any, Tuple[float, Any]] = {}
+
+    def get(self, key: Any) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._items[key]
+            return None
+        return value
+
+    def set(self, key: Any, value: Any):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+
+    def prune(self):
+        now = time.monotonic()
+        expired = [k for k, (exp, _) in self._items.items() if exp < now]
+        for key in expired:
+            del self._items[key]
+
+
+def _rows(conn: sqlite3.Connection, sql: str, params: tuple
+          ) -> List[Dict[str, Any]]:
+    cur = conn.execute(sql, params)
+    columns = [d[0] for d in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def _since(days: int) -> str:
+    return (datetime.datetime.now()
+            - datetime.timedelta(days=days)).isoformat()
+
+
+def query_win_rates(conn: sqlite3.Connection, days: int, thresh: int
+                    ) -> List[Dict[str, Any]]:
+    rows = _rows(conn, SQL_WIN_RATES, (_since(days), thresh))
+    for row in rows:
+        played = row["games_played"]
+        row["axis_win_rate"] = row["axis_wins"] / played if played else None
+        row["allies_win_rate"] = row["allies_wins"] / played if played else None
+    return rows
+
+
+def query_win_conditions(conn: sqlite3.Connection, days: int, thresh: int
+                         ) -> List[Dict[str, Any]]:
+    return _rows(conn, SQL_WIN_CONDITIONS, (_since(days), thresh))
+
+
+def query_hottest_objectives(conn: sqlite3.Connection, days: int,
+                             thresh: int, n: int) -> Dict[str, Any]:
+    """Hottest objectives per map. If database retention has folded
+    objective details in the window into monthly aggregates, counts
+    only include rounds since objective_details_since.
+    """
+    since = _since(days)
+    details_since = db.objective_details_since(conn)
+    if details_since is not None and since >= details_since.isoformat():
+        details_since = None
+    return {
+        "objective_details_since": (details_since.isoformat()
+                                    if details_since else None),
+        "objectives": _rows(conn, SQL_HOTTEST_OBJECTIVES, (since, thresh, n)),
+    }
+
+
+def query_daily(conn: sqlite3.Connection, days: int, thresh: int
+                ) -> List[Dict[str, Any]]:
+    """Daily and rolling per-map series, computed the same
+    way as in reports by db.daily_map_stats.
+    """
+    # Fetch enough history for the rolling windows of the first days.
+    lookback = days + max(db.ROLLING_WINDOWS)
+    df = pd.read_sql_query(SQL_DAILY, conn, params=(_since(lookback), thresh))
+    df["match_datetime"] = pd.to_datetime(df["match_datetime"])
+    df["axis_win"] = df["winning_team"] == "Axis"
+    df["allies_win"] = df["winning_team"] == "Allies"
+
+    daily = db.daily_map_stats(df)
+    start = pd.Timestamp(_since(days)).floor("1D")
+    daily = daily.loc[daily["date"] >= start].sort_values(["name", "date"])
+    daily["date"] = daily["date"].dt.strftime("%Y-%m-%d")
+    return daily.astype(object).where(daily.notna(), None).to_dict("records")
+
+
+def _int_param(query: Dict[str, List[str]], name: str, default: int,
+               maximum: int = MAX_INT_PARAM) -> int:
+    try:
+        value = abs(int(query.get(name, [default])[0]))
+    except ValueError:
+        raise BadRequest(f"invalid integer value for '{name}'")
+    if value > maximum:
+        raise BadRequest(f"value of '{name}' must be at most {maximum}")
+    return value
+
+
+class StatsServer:
+    """Asyncio HTTP server exposing the statistics endpoints."""
+
+    def __init__(self, manager: db.ConnectionManager,
+                 cache_ttl: float = DEFAULT_CACHE_TTL,
+                 workers: int = db.DEFAULT_READ_POOL_SIZE):
+        self.manager = manager
+        self.cache = TTLCache(cache_ttl)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="stats-api")
+        self._inflight: Dict[Any, asyncio.Future] = {}
+        self.routes: Dict[str, Callable[[Dict[str, List[str]]], Any]] = {
+            "/maps/win-rates": self._win_rates,
+            "/maps/win-conditions": self._win_conditions,
+            "/objectives/hottest": self._hottest_objectives,
+            "/daily": self._daily,
+        }
+
+    def _run_query(self, func: Callable, *args) -> Any:
+        with self.manager.read_conn() as conn:
+            return func(conn, *args)
+
+    async def _cached(self, func: Callable, *args) -> Any:
+        key = (func.__name__, *args)
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+
+        # Concurrent misses for the same key share a single query.
+        fut = self._inflight.get(key)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(
+                self._executor, self._run_query, func, *args)
+            self._inflight[key] = fut
+            try:
+                value = await asyncio.shield(fut)
+            finally:
+                del self._inflight[key]
+            self.cache.set(key, value)
+            return value
+        return await asyncio.shield(fut)
+
+    async def _win_rates(self, query: Dict[str, List[str]]) -> Any:
+        days = _int_param(query, "days", DEFAULT_DAYS, MAX_DAYS)
+        thresh = _int_param(query, "thresh", 0)
+        return await self._cached(query_win_rates, days, thresh)
+
+    async def _win_conditions(self, query: Dict[str, List[str]]) -> Any:
+        days = _int_param(query, "days", DEFAULT_DAYS, MAX_DAYS)
+        thresh = _int_param(query, "thresh", 0)
+        return await self._cached(query_win_conditions, days, thresh)
+
+    async def _hottest_objectives(self, query: Dict[str, List[str]]) -> Any:
+        days = _int_param(query, "days", DEFAULT_DAYS, MAX_DAYS)
+        thresh = _int_param(query, "thresh", 0)
+        n = _int_param(query, "n", 3)
+        return await self._cached(query_hottest_objectives, days, thresh, n)
+
+    async def _daily(self, query: Dict[str, List[str]]) -> Any:
+        days = _int_param(query, "days", DEFAULT_DAYS, MAX_DAYS)
+        thresh = _int_param(query, "thresh", 0)
+        return await self._cached(query_daily, days, thresh)
+
+    async def _dispatch(self, method: str, target: str
+                        ) -> Tuple[HTTPStatus, Any]:
+        if method not in ("GET", "HEAD"):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "method not allowed"}
+
+        url = urlsplit(target)
+        route = self.routes.get(url.path.rstrip("/") or "/")
+        if route is None:
+            if url.path == "/":
+                return HTTPStatus.OK, {"endpoints": sorted(self.routes)}
+            return HTTPStatus.NOT_FOUND, {"error": "not found"}
+
+        try:
+            data = await route(parse_qs(url.query))
+        except BadRequest as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        except Exception as e:
+            print(f"error handling '{target}': {repr(e)}", file=sys.stderr)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "internal error"}
+        return HTTPStatus.OK, {"data": data}
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+
+            request_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+            parts = request_line.split()
+            if len(parts) != 3:
+                status, body = HTTPStatus.BAD_REQUEST, {"error": "bad request"}
+                method = "GET"
+            else:
+                method, target, _ = parts
+                status, body = await self._dispatch(method, target)
+
+            payload = json.dumps(body).encode("utf-8")
+            headers = (
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n"
+                f"\r\n"
+            ).encode("latin-1")
+            writer.write(headers if method == "HEAD" else headers + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _prune_cache(self):
+        while True:
+            await asyncio.sleep(self.cache.ttl)
+            self.cache.prune()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        server = await asyncio.start_server(
+            self.handle, host, port, limit=MAX_REQUEST_HEAD_SIZE)
+        pruner = asyncio.create_task(self._prune_cache())
+        addrs = ", ".join(str(s.getsockname()) for s in server.sockets)
+        print(f"serving statistics API on {addrs}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            pruner.cancel()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser()
+
+    ap.add_argument(
+        "database",
+        help="path to database file",
+    )
+    ap.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help="address to listen on (default=%(default)s)",
+    )
+    ap.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help="port to listen on (default=%(default)s)",
+    )
+    ap.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_CACHE_TTL,
+        metavar="SECONDS",
+        help="how long query results are cached (default=%(default)s)",
+    )
+
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    db_path = Path(args.database)
+    if not db_path.exists():
+        print(f"database '{db_path.absolute()}' does not exist",
+              file=sys.stderr)
+        sys.exit(1)
+
+    manager = db.open_db(db_path)
+    server = StatsServer(manager, cache_ttl=args.cache_ttl)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
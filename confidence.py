@@ -0,0 +1,194 @@
+"""Confidence intervals for per-map win rates and win condition shares."""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+CI_METHODS = ("wilson", "bootstrap")
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_RESAMPLES = 10000
+# Resampled values drawn at once per worker, bounds memory use.
+BLOCK_SIZE = 2 ** 22
+# Below this many resampled values in total a process pool
+# costs more than it saves.
+PARALLEL_THRESHOLD = 2 ** 24
+
+
+def wilson_interval(successes: np.ndarray, totals: np.ndarray,
+                    confidence: float = DEFAULT_CONFIDENCE
+                    ) -> Tuple[np.ndarray, np.ndarray]:
+    """Wilson score interval for each proportion successes / totals.
+    Intervals for zero totals are NaN.
+    """
+    successes = np.asarray(successes, dtype=float)
+    totals = np.asarray(totals, dtype=float)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = successes / totals
+        denom = 1 + z ** 2 / totals
+        center = (p + z ** 2 / (2 * totals)) / denom
+        half = (z / denom) * np.sqrt(
+            p * (1 - p) / totals + z ** 2 / (4 * totals ** 2))
+
+    lo = np.clip(center - half, 0.0, 1.0)
+    hi = np.clip(center + half, 0.0, 1.0)
+    return lo, hi
+
+
+def _bootstrap_block(successes: np.ndarray, totals: np.ndarray,
+                     n_resamples: int, confidence: float,
+                     seed: np.random.SeedSequence
+                     ) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    alpha = 1 - confidence
+    lo = np.full(len(totals), np.nan)
+    hi = np.full(len(totals), np.nan)
+
+    # Resampling n Bernoulli outcomes with replacement and counting the
+    # successes is a Binomial(n, p) draw, so rows never need to be touched.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = np.where(totals > 0, successes / totals, 0.0)
+    rows = max(1, BLOCK_SIZE // max(1, n_resamples))
+    for start in range(0, len(totals), rows):
+        stop = start + rows
+        n = totals[start:stop, None]
+        draws = rng.binomial(n, p[start:stop, None],
+                             size=(len(n), n_resamples))
+        q = np.quantile(draws, [alpha / 2, 1 - alpha / 2], axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lo[start:stop] = q[0] / totals[start:stop]
+            hi[start:stop] = q[1] / totals[start:stop]
+
+    return lo, hi
+
+
+def _wilson_if_degenerate(successes: np.ndarray, totals: np.ndarray,
+                          confidence: float, lo: np.ndarray, hi: np.ndarray
+                          ) -> Tuple[np.ndarray, np.ndarray]:
+    degenerate = (totals > 0) & ((successes == 0) | (successes == totals))
+    if degenerate.any():
+        w_lo, w_hi = wilson_interval(
+            successes[degenerate], totals[degenerate], confidence)
+        lo[degenerate] = w_lo
+        hi[degenerate] = w_hi
+    return lo, hi
+
+
+def bootstrap_interval(successes: np.ndarray, totals: np.ndarray,
+                       confidence: float = DEFAULT_CONFIDENCE,
+                       n_resamples: int = DEFAULT_RESAMPLES,
+                       seed: Optional[int] = None,
+                       workers: Optional[int] = None,
+                       ) -> Tuple[np.ndarray, np.ndarray]:
+    """Percentile bootstrap interval for each proportion
+    successes / totals. All proportions are resampled at once.
+    Large problems are split across a process pool.
+
+    Resamples of 0 or all successes never vary, so the percentile
+    interval would have zero width. Wilson bounds are used for them.
+    """
+    successes = np.asarray(successes, dtype=np.int64)
+    totals = np.asarray(totals, dtype=np.int64)
+    seed_seq = np.random.SeedSequence(seed)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(totals))
+    if workers <= 1 or len(totals) * n_resamples < PARALLEL_THRESHOLD:
+        lo, hi = _bootstrap_block(
+            successes, totals, n_resamples, confidence, seed_seq)
+        return _wilson_if_degenerate(successes, totals, confidence, lo, hi)
+
+    chunks = np.array_split(np.arange(len(totals)), workers)
+    seeds = seed_seq.spawn(len(chunks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            _bootstrap_block,
+            [successes[c] for c in chunks],
+            [totals[c] for c in chunks],
+            [n_resamples] * len(chunks),
+            [confidence] * len(chunks),
+            seeds,
+        ))
+
+    lo = np.concatenate([r[0] for r in results])
+    hi = np.concatenate([r[1] for r in results])
+    return _wilson_if_degenerate(successes, totals, confidence, lo, hi)
+
+
+def proportion_interval(successes: np.ndarray, totals: np.ndarray,
+                        method: str = "wilson",
+                        confidence: float = DEFAULT_CONFIDENCE,
+                        n_resamples: int = DEFAULT_RESAMPLES,
+                        seed: Optional[int] = None,
+                        ) -> Tuple[np.ndarray, np.ndarray]:
+    if method == "wilson":
+        return wilson_interval(successes, totals, confidence)
+    elif method == "bootstrap":
+        return bootstrap_interval(
+            successes, totals, confidence, n_resamples, seed)
+    raise ValueError(f"invalid confidence interval method: '{method}'")
+
+
+def format_interval(low: float, high: float,
+                    confidence: float = DEFAULT_CONFIDENCE) -> str:
+    """Format interval bounds as percentages. Undefined intervals,
+    e.g. of maps without decided rounds, are formatted as "[n/a]".
+    """
+    if np.isnan(low) or np.isnan(high):
+        return "[n/a]"
+    return f"[{confidence:.0%} CI {low:.1%}-{high:.1%}]"
+
+
+def win_rate_intervals(df: pd.DataFrame, method: str = "wilson",
+                       confidence: float = DEFAULT_CONFIDENCE,
+                       n_resamples: int = DEFAULT_RESAMPLES,
+                       seed: Optional[int] = None) -> pd.DataFrame:
+    """Allies win rate with confidence interval for every map.
+    Rounds without an Axis or Allies winner are not counted.
+    """
+    wins = pd.crosstab(df["name"], df["winning_team"].fillna(""))
+    wins = wins.reindex(columns=["Axis", "Allies"], fill_value=0)
+    total = wins["Axis"] + wins["Allies"]
+    lo, hi = proportion_interval(
+        wins["Allies"].to_numpy(), total.to_numpy(),
+        method, confidence, n_resamples, seed)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = wins["Allies"] / total
+    return pd.DataFrame({
+        "num_axis_win": wins["Axis"],
+        "num_allies_win": wins["Allies"],
+        "allies_win_rate": rate.fillna(0.0),
+        "ci_low": lo,
+        "ci_high": hi,
+    }, index=wins.index)
+
+
+def win_condition_intervals(df: pd.DataFrame, method: str = "wilson",
+                            confidence: float = DEFAULT_CONFIDENCE,
+                            n_resamples: int = DEFAULT_RESAMPLES,
+                            seed: Optional[int] = None) -> pd.DataFrame:
+    """Share of each win condition with confidence interval, indexed
+    by map name and win condition.
+    """
+    counts = df.groupby(["name", "win_condition"]).size().rename("count")
+    totals = counts.groupby(level="name").transform("sum")
+    lo, hi = proportion_interval(
+        counts.to_numpy(), totals.to_numpy(),
+        method, confidence, n_resamples, seed)
+
+    return pd.DataFrame({
+        "count": counts,
+        "share": counts / totals,
+        "ci_low": lo,
+        "ci_high": hi,
+    }, index=counts.index)
@@ -0,0 +1,365 @@
+"""Long-running ingestion and report daemon.
+
+Keeps the parser process pool, database connection and analysis
+libraries loaded between cycles. Configured log directories are
+scanned periodically and only new or grown log files are parsed,
+starting from where the previous cycle left off.
+"""
+
+from __future__ import annotations
+
+import argparse
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import matplotlib
+
+# Reports are never shown interactively by the daemon.
+matplotlib.use("Agg")
+
+import confidence  # noqa: E402
+import db  # noqa: E402
+import parse  # noqa: E402
+from webhook import WebhookPublisher  # noqa: E402
+
+DEFAULT_PATTERN = "*.log"
+DEFAULT_SCAN_INTERVAL = 60.0
+DEFAULT_REPORT_INTERVAL = 24 * 60 * 60.0
+RETENTION_INTERVAL = 24 * 60 * 60.0
+
+
+def _ignore_sigint():
+    # Workers are shut down by the daemon, not by Ctrl+C.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+@dataclass
+class LogFileState:
+    header: bytes
+    size: int
+    mtime_ns: int
+    offset: int
+
+
+def _read_header(path: Path) -> bytes:
+    with path.open("rb") as f:
+        return f.readline()
+
+
+class Daemon:
+    def __init__(self, db_path: Path, log_dirs: List[Path],
+                 pattern: str = DEFAULT_PATTERN,
+                 server_id: str = "",
+                 scan_interval: float = DEFAULT_SCAN_INTERVAL,
+                 report_days: Optional[int] = None,
+                 report_interval: float = DEFAULT_REPORT_INTERVAL,
+                 thresh: int = 0,
+                 discord_webhook: Optional[str] = None,
+                 retention_months: Optional[int] = None,
+                 enable_incremental_vacuum: bool = False,
+                 ci: Optional[str] = None,
+                 n_resamples: int = confidence.DEFAULT_RESAMPLES,
+                 workers: Optional[int] = None):
+        self.db_path = db_path
+        self.log_dirs = log_dirs
+        self.pattern = pattern
+        self.server_id = server_id
+        self.scan_interval = scan_interval
+        self.report_days = report_days
+        self.report_interval = report_interval
+        self.thresh = thresh
+        self.discord_webhook = discord_webhook
+        self.retention_months = retention_months
+        self.enable_incremental_vacuum = enable_incremental_vacuum
+        self.ci = ci
+        self.n_resamples = n_resamples
+        self.workers = workers
+
+        self._files: Dict[Path, LogFileState] = {}
+        self._stop = threading.Event()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def _start_executor(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_ignore_sigint)
+
+    def scan(self) -> List[Tuple[Path, LogFileState]]:
+        """Return log files that are new or have changed since
+        the last scan, with the offset to continue parsing from.
+        """
+        changed = []
+        for log_dir in self.log_dirs:
+            for path in sorted(log_dir.glob(self.pattern)):
+                try:
+                    stat = path.stat()
+                    old = self._files.get(path)
+                    if (old and stat.st_size == old.size
+                            and stat.st_mtime_ns == old.mtime_ns):
+                        continue
+                    header = _read_header(path)
+                except EnvironmentError as e:
+                    print(f"error reading '{path.absolute()}': {repr(e)}",
+                          file=sys.stderr)
+                    continue
+
+                offset = 0
+                # A different header or a smaller file means the log
+                # was rotated and this is a new file at the same path.
+                if (old and header == old.header
+                        and stat.st_size >= old.size):
+                    offset = old.offset
+                changed.append((path, LogFileState(
+                    header=header,
+                    size=stat.st_size,
+                    mtime_ns=stat.st_mtime_ns,
+                    offset=offset,
+                )))
+        return changed
+
+    def ingest(self) -> int:
+        changed = self.scan()
+        if not changed:
+            return 0
+
+        map_stats = []
+        try:
+            futs = [
+                (path, state, self._executor.submit(
+                    parse.parse_stats_from, path, self.server_id,
+                    state.offset))
+                for path, state in changed
+            ]
+            for path, state, fut in futs:
+                stats, state.offset = fut.result()
+                map_stats.extend(stats)
+        except BrokenProcessPool:
+            # A worker died, e.g. killed by the OOM killer. The pool
+            # rejects all further work, so replace it. No file state
+            # was updated, the changed files are parsed again next cycle.
+            print("log parser process pool broken, restarting it",
+                  file=sys.stderr)
+            self._executor.shutdown(wait=False)
+            self._start_executor()
+            raise
+
+        if map_stats:
+            db.insert_map_stats(map_stats)
+            print(f"ingested {len(map_stats)} rounds "
+                  f"from {len(changed)} log file(s)")
+        for path, state in changed:
+            self._files[path] = state
+        return len(map_stats)
+
+    def report(self):
+        print(f"generating report with player threshold '{self.thresh}' "
+              f"for the last '{self.report_days}' days")
+        # Charts are not shown by the daemon, reports are
+        # only useful when posted to a webhook.
+        with WebhookPublisher(self.discord_webhook) as publisher:
+            db.generate_report(
+                self.thresh, self.report_days, publisher=publisher,
+                ci=self.ci, n_resamples=self.n_resamples)
+        if publisher.errors:
+            print(f"{len(publisher.errors)} webhook upload(s) failed",
+                  file=sys.stderr)
+
+    def apply_retention(self):
+        removed = db.apply_retention(self.retention_months)
+        print(f"folded {removed} objective rows older than "
+              f"{self.retention_months} months into aggregates")
+        if not db.compact_db():
+            print("database does not use incremental auto vacuum, "
+                  "free pages were not released, see "
+                  "--enable-incremental-vacuum")
+
+    def _run_scheduled(self, name: str, func):
+        try:
+            func()
+        except Exception as e:
+            print(f"error in {name}: {repr(e)}", file=sys.stderr)
+
+    def run(self):
+        db.init_db(self.db_path)
+        if self.enable_incremental_vacuum:
+            print("converting database to incremental auto vacuum")
+            db.enable_incremental_vacuum()
+        self._start_executor()
+
+        schedule = [["ingest", self.ingest, self.scan_interval, 0.0]]
+        if self.report_days is not None:
+            schedule.append(
+                ["report", self.report, self.report_interval, 0.0])
+        if self.retention_months is not None:
+            schedule.append(
+                ["retention", self.apply_retention, RETENTION_INTERVAL, 0.0])
+
+        print(f"daemon started, watching {len(self.log_dirs)} "
+              f"log director{'y' if len(self.log_dirs) == 1 else 'ies'}")
+        try:
+            while not self._stop.is_set():
+                for task in schedule:
+                    name, func, interval, next_run = task
+                    if self._stop.is_set():
+                        break
+                    if time.monotonic() >= next_run:
+                        self._run_scheduled(name, func)
+                        task[3] = time.monotonic() + interval
+                next_run = min(task[3] for task in schedule)
+                self._stop.wait(max(0.0, next_run - time.monotonic()))
+        finally:
+            print("daemon stopping")
+            self._executor.shutdown(wait=True)
+            db.close_db()
+
+
+def parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser()
+
+    ap.add_argument(
+        "database",
+        help="path to database file",
+    )
+    ap.add_argument(
+        "log_dir",
+        nargs="+",
+        help="directory to scan for server log files",
+    )
+    ap.add_argument(
+        "--pattern",
+        default=DEFAULT_PATTERN,
+        help="glob pattern of log files in log directories "
+             "(default=%(default)s)",
+    )
+    ap.add_argument(
+        "--server-id",
+        default="",
+        help="unique server identifier for values stored in database",
+    )
+    ap.add_argument(
+        "--scan-interval",
+        type=float,
+        default=DEFAULT_SCAN_INTERVAL,
+        metavar="SECONDS",
+        help="how often log directories are scanned (default=%(default)s)",
+    )
+    ap.add_argument(
+        "--report-days",
+        type=int,
+        metavar="D",
+        help="periodically generate report for the last D days and "
+             "post it to --discord-webhook, which is required",
+    )
+    ap.add_argument(
+        "--report-interval",
+        type=float,
+        default=DEFAULT_REPORT_INTERVAL,
+        metavar="SECONDS",
+        help="how often reports are generated (default=%(default)s)",
+    )
+    ap.add_argument(
+        "-p",
+        "--player-threshold",
+        type=int,
+        default=0,
+        help="minimum number of players required to "
+             "include round in reports (default=%(default)s)",
+    )
+    ap.add_argument(
+        "--discord-webhook",
+        help="Discord webhook URL to post reports to",
+    )
+    ap.add_argument(
+        "--retention-months",
+        type=int,
+        metavar="N",
+        help="daily fold map end objective details older than N months "
+             "into monthly per-map aggregates and compact the database. "
+             "Compaction only releases disk space in databases using "
+             "incremental auto vacuum, older databases need a one-time "
+             "--enable-incremental-vacuum first",
+    )
+    ap.add_argument(
+        "--enable-incremental-vacuum",
+        action="store_true",
+        default=False,
+        help="convert an existing database to incremental auto vacuum "
+             "with a one-time full VACUUM, which rewrites the whole "
+             "database file and blocks writes while running",
+    )
+    ap.add_argument(
+        "--confidence-interval",
+        dest="ci",
+        choices=confidence.CI_METHODS,
+        help="include confidence intervals for win rates and "
+             "win condition shares in reports, computed with "
+             "the given method "
+             "(wilson is recommended for maps with few rounds)",
+    )
+    ap.add_argument(
+        "--bootstrap-resamples",
+        type=int,
+        default=confidence.DEFAULT_RESAMPLES,
+        metavar="N",
+        help="number of resamples for bootstrap confidence "
+             "intervals (default=%(default)s)",
+    )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        help="number of log parser processes (default=CPU count)",
+    )
+
+    args = ap.parse_args()
+    if args.report_days is not None and not args.discord_webhook:
+        ap.error("--report-days requires --discord-webhook")
+    return args
+
+
+def main():
+    args = parse_args()
+
+    db_path = Path(args.database)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    db_path.touch(exist_ok=True)
+
+    daemon = Daemon(
+        db_path=db_path,
+        log_dirs=[Path(d) for d in args.log_dir],
+        pattern=args.pattern,
+        server_id=args.server_id,
+        scan_interval=args.scan_interval,
+        report_days=args.report_days,
+        report_interval=args.report_interval,
+        thresh=args.player_threshold,
+        discord_webhook=args.discord_webhook,
+        retention_months=args.retention_months,
+        enable_incremental_vacuum=args.enable_incremental_vacuum,
+        ci=args.ci,
+        n_resamples=args.bootstrap_resamples,
+        workers=args.workers,
+    )
+
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    daemon.run()
+
+
+if __name__ == "__main__":
+    import multiprocessing
+
+    multiprocessing.freeze_support()
+
+    main()
@@ -2,13 +2,21 @@
 
 from __future__ import annotations
 
+import csv
 import datetime
+import io
+import queue
 import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
 from pathlib import Path
-from pprint import pprint
+from pprint import pformat
 from typing import Callable
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Tuple
 
 import matplotlib.pyplot as plt
 import matplotlib.ticker
@@ -16,33 +24,209 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 
+import confidence
 from mapstats import MapStats
+from objectives import build_objective_matrices
+from webhook import WebhookPublisher
 
 sns.set()
 
 MAP_STATS_TABLE = "mapstats"
 MAP_END_OBJECTIVES_TABLE = "map_end_objectives"
-CONN: Optional[sqlite3.Connection] = None
+OBJECTIVE_HISTORY_TABLE = "map_objective_history"
+DEFAULT_READ_POOL_SIZE = 4
+DEFAULT_EXPORT_CHUNK_SIZE = 10000
+EXPORT_FORMATS = ("csv", "parquet")
+ROLLING_WINDOWS = (7, 30)
+BUSY_TIMEOUT_MS = 5000
 
 
-def get_conn() -> sqlite3.Connection:
-    global CONN
-    if not CONN:
+class _ThreadConn:
+    """Holds a thread's connection in thread-local storage. Dropped
+    together with the storage when the thread exits.
+    """
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+class ConnectionManager:
+    """Hands out SQLite connections to a single database file.
+
+    Every thread gets its own read-write connection, which is closed
+    when the thread exits or the manager is closed. Read-only
+    connections for report queries are borrowed from a small pool.
+    The database is switched to WAL mode so that readers never
+    block the writer and vice versa.
+    """
+
+    def __init__(self, db_path: Path,
+                 read_pool_size: int = DEFAULT_READ_POOL_SIZE,
+                 read_only: bool = False):
+        self.db_path = db_path.absolute()
+        self.read_only = read_only
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns: List[sqlite3.Connection] = []
+        self._read_pool: queue.Queue = queue.Queue(maxsize=read_pool_size)
+        self._read_pool_size = read_pool_size
+        self._read_conns_created = 0
+        self._closed = False
+
+    def _track(self, conn: sqlite3.Connection):
+        with self._lock:
+            if self._closed:
+                conn.close()
+                raise RuntimeError("connection manager closed")
+            self._conns.append(conn)
+
+    def _setup(self, conn: sqlite3.Connection):
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA foreign_keys = ON")
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._lock:
+            try:
+                self._conns.remove(conn)
+            except ValueError:
+                pass
+        conn.close()
+
+    def get_conn(self) -> sqlite3.Connection:
+        """Return read-write connection owned by the calling thread."""
+        if self.read_only:
+            raise RuntimeError("connection manager is read-only")
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            # Connections are only ever used by the thread that created
+            # them, but close() may be called from any thread.
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._setup(conn)
+            self._track(conn)
+            holder = _ThreadConn(conn)
+            self._local.holder = holder
+            weakref.finalize(holder, self._release, conn)
+        return holder.conn
+
+    def _new_read_conn(self) -> sqlite3.Connection:
+        uri = f"{self.db_path.as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        try:
+            self._setup(conn)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        self._track(conn)
+        return conn
+
+    @contextmanager
+    def read_conn(self) -> Iterator[sqlite3.Connection]:
+        """Borrow read-only connection from the pool."""
+        if self._closed:
+            raise RuntimeError("connection manager closed")
+        try:
+            conn = self._read_pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._read_conns_created < self._read_pool_size
+                if create:
+                    self._read_conns_created += 1
+            if create:
+                try:
+                    conn = self._new_read_conn()
+                except Exception:
+                    # Free the slot, otherwise failed opens would
+                    # eventually leave every caller waiting on the pool.
+                    with self._lock:
+                        self._read_conns_created -= 1
+                    raise
+            else:
+                conn = self._read_pool.get()
+        if conn is None or self._closed:
+            raise RuntimeError("connection manager closed")
+        try:
+            yield conn
+        finally:
+            if not self._closed:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._read_pool.put(conn)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            conns = self._conns
+            self._conns = []
+        for conn in conns:
+            conn.close()
+        # Wake up threads waiting for a pooled connection.
+        while True:
+            try:
+                self._read_pool.put_nowait(None)
+            except queue.Full:
+                break
+
+
+_MANAGER: Optional[ConnectionManager] = None
+
+
+def get_manager() -> ConnectionManager:
+    if not _MANAGER:
         raise RuntimeError("database not initialized")
-    return CONN
+    return _MANAGER
+
+
+def set_manager(manager: Optional[ConnectionManager]
+                ) -> Optional[ConnectionManager]:
+    """Replace module connection manager and return the previous one.
+    Mainly useful for tests. The previous manager is not closed.
+    """
+    global _MANAGER
+    old = _MANAGER
+    _MANAGER = manager
+    return old
+
+
+def close_db():
+    """Close all connections of the module connection manager."""
+    old = set_manager(None)
+    if old:
+        old.close()
+
+
+def get_conn() -> sqlite3.Connection:
+    return get_manager().get_conn()
+
+
+def open_db(db_path: Path,
+            read_pool_size: int = DEFAULT_READ_POOL_SIZE
+            ) -> ConnectionManager:
+    """Initialize read-only module connection manager for an existing
+    database. Unlike init_db, the database file is not modified.
+    """
+    manager = ConnectionManager(
+        db_path, read_pool_size=read_pool_size, read_only=True)
+    close_db()
+    set_manager(manager)
+    return manager
 
 
 # noinspection SqlNoDataSourceInspection
-def init_db(db_path: Path):
-    """Return connection to database and
+def init_db(db_path: Path,
+            read_pool_size: int = DEFAULT_READ_POOL_SIZE
+            ) -> ConnectionManager:
+    """Initialize module connection manager and
     create tables if needed.
     """
-    global CONN
+    manager = ConnectionManager(db_path, read_pool_size=read_pool_size)
+    conn = manager.get_conn()
 
-    conn = sqlite3.connect(str(db_path.absolute()))
-
-    with conn:
-        conn.execute("PRAGMA foreign_keys = ON")
+    # Both are persistent and stored in the database file. Auto vacuum
+    # mode only takes effect immediately for new databases, existing
+    # ones are converted by enable_incremental_vacuum().
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
 
     with conn:
         conn.execute("begin")
@@ -84,7 +268,35 @@ def init_db(db_path: Path):
             """
         )
 
-    CONN = conn
+    # Map end objectives are already ordered by time by their primary key.
+    with conn:
+        conn.execute("begin")
+        conn.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS {MAP_STATS_TABLE}_match_datetime_idx
+            ON {MAP_STATS_TABLE} (match_datetime)
+            """
+        )
+
+    with conn:
+        conn.execute("begin")
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {OBJECTIVE_HISTORY_TABLE} (
+                map_name TEXT NOT NULL,
+                month TEXT NOT NULL,
+                obj_name TEXT NOT NULL,
+                holder TEXT NOT NULL,
+                win_condition TEXT NOT NULL,
+                rounds INTEGER NOT NULL,
+                PRIMARY KEY (map_name, month, obj_name, holder, win_condition)
+            )
+            """
+        )
+
+    close_db()
+    set_manager(manager)
+    return manager
 
 
 # noinspection SqlNoDataSourceInspection
@@ -164,7 +376,250 @@ def insert_map_stats(map_stats: List[MapStats]):
         conn.executemany(sql_active_objs, active_objs)
 
 
-def plot_win_ratio_pies(map_stats_df: pd.DataFrame, pie_fmt_func: Callable):
+def retention_cutoff(months: int,
+                     now: Optional[datetime.datetime] = None
+                     ) -> datetime.datetime:
+    """Return start of the calendar month months before now."""
+    if now is None:
+        now = datetime.datetime.now()
+    month_index = now.year * 12 + (now.month - 1) - int(abs(months))
+    return datetime.datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+# noinspection SqlNoDataSourceInspection
+def apply_retention(months: int) -> int:
+    """Fold map end objective rows older than months calendar months
+    into monthly per-map aggregates and delete the raw rows.
+    Returns the number of raw rows removed.
+    """
+    conn = get_conn()
+    cutoff = retention_cutoff(months).isoformat()
+
+    sql_fold = f"""
+    INSERT INTO {OBJECTIVE_HISTORY_TABLE} (
+        map_name,
+        month,
+        obj_name,
+        holder,
+        win_condition,
+        rounds
+    )
+    SELECT
+        o.map_name,
+        SUBSTR(o.match_datetime, 1, 7),
+        o.obj_name,
+        COALESCE(o.holder, ''),
+        COALESCE(m.win_condition, ''),
+        COUNT(*)
+    FROM {MAP_END_OBJECTIVES_TABLE} o
+    JOIN {MAP_STATS_TABLE} m
+        ON m.match_datetime = o.match_datetime
+        AND m.server_id = o.server_id
+        AND m.name = o.map_name
+    WHERE o.match_datetime < ?
+    AND o.obj_index IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (map_name, month, obj_name, holder, win_condition)
+    DO UPDATE SET rounds = rounds + excluded.rounds
+    """
+
+    sql_delete = f"""
+    DELETE FROM {MAP_END_OBJECTIVES_TABLE}
+    WHERE match_datetime < ?
+    """
+
+    with conn:
+        conn.execute("begin")
+        conn.execute(sql_fold, (cutoff,))
+        deleted = conn.execute(sql_delete, (cutoff,)).rowcount
+
+    return deleted
+
+
+# noinspection SqlNoDataSourceInspection
+def objective_details_since(conn: sqlite3.Connection
+                            ) -> Optional[datetime.datetime]:
+    """Return the datetime from which map end objective details are
+    stored in full, or None if retention has never folded any rows
+    into monthly aggregates. Older rounds only have aggregates in
+    the objective history table.
+    """
+    try:
+        month = conn.execute(
+            f"SELECT MAX(month) FROM {OBJECTIVE_HISTORY_TABLE}").fetchone()[0]
+    except sqlite3.OperationalError:
+        # Database created before the history table existed.
+        return None
+    if month is None:
+        return None
+    year, month = (int(x) for x in month.split("-"))
+    return datetime.datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def compact_db() -> bool:
+    """Reclaim free pages, refresh query planner statistics
+    and truncate the write-ahead log.
+
+    Free pages are only released in databases using incremental
+    auto vacuum, see enable_incremental_vacuum(). Returns whether
+    free pages were released.
+    """
+    conn = get_conn()
+    conn.execute("ANALYZE")
+    auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    incremental = auto_vacuum == 2
+    if incremental:
+        # Free pages are released in place without rewriting the
+        # whole database. Run as a script, the sqlite3 module only
+        # steps a plain execute() once, freeing one page.
+        conn.executescript("PRAGMA incremental_vacuum;")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return incremental
+
+
+def enable_incremental_vacuum():
+    """Convert an existing database to incremental auto vacuum.
+
+    This is a one-time full VACUUM. It rewrites the whole database
+    file, needs free disk space of about the database size and
+    blocks writers until it is done. Databases created by init_db()
+    already use incremental auto vacuum.
+    """
+    conn = get_conn()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+EXPORT_COLUMNS = [
+    ("name", "string"),
+    ("players", "int64"),
+    ("winning_team", "string"),
+    ("time_remaining", "int64"),
+    ("teams_swapped", "int64"),
+    ("axis_reinforcements", "int64"),
+    ("allies_reinforcements", "int64"),
+    ("win_condition", "string"),
+    ("axis_team_score", "int64"),
+    ("allies_team_score", "int64"),
+    ("match_datetime", "string"),
+    ("server_id", "string"),
+    ("obj_index", "int64"),
+    ("obj_name", "string"),
+    ("holder", "string"),
+]
+
+
+def _iter_export_chunks(conn: sqlite3.Connection,
+                        start: Optional[datetime.datetime],
+                        end: Optional[datetime.datetime],
+                        server_id: Optional[str],
+                        chunk_size: int) -> Iterator[List[tuple]]:
+    where = []
+    params = []
+    if start:
+        where.append("m.match_datetime >= ?")
+        params.append(start.isoformat())
+    if end:
+        where.append("m.match_datetime < ?")
+        params.append(end.isoformat())
+    if server_id is not None:
+        where.append("m.server_id = ?")
+        params.append(server_id)
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+    objective_columns = ("obj_index", "obj_name", "holder")
+    select = ", ".join(
+        f"o.{c}" if c in objective_columns else f"m.{c}"
+        for c, _ in EXPORT_COLUMNS
+    )
+
+    # noinspection SqlNoDataSourceInspection
+    sql = f"""
+    SELECT {select}
+    FROM {MAP_STATS_TABLE} m
+    LEFT JOIN {MAP_END_OBJECTIVES_TABLE} o
+        ON o.match_datetime = m.match_datetime
+        AND o.server_id = m.server_id
+        AND o.map_name = m.name
+    {where_sql}
+    ORDER BY m.match_datetime, m.server_id, m.name, o.obj_index
+    """
+
+    cur = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def export_map_stats(out: Path, fmt: str = "csv",
+                     start: Optional[datetime.datetime] = None,
+                     end: Optional[datetime.datetime] = None,
+                     server_id: Optional[str] = None,
+                     chunk_size: int = DEFAULT_EXPORT_CHUNK_SIZE) -> int:
+    """Stream map statistics joined with map end objectives
+    to a CSV or Parquet file, one chunk of rows at a time.
+    Returns the number of rows written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"invalid export format: '{fmt}'")
+
+    if fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow")
+        schema = pa.schema([(c, getattr(pa, t)()) for c, t in EXPORT_COLUMNS])
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    num_rows = 0
+    with get_manager().read_conn() as conn:
+        chunks = _iter_export_chunks(conn, start, end, server_id, chunk_size)
+        if fmt == "csv":
+            with out.open("w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow([c for c, _ in EXPORT_COLUMNS])
+                for rows in chunks:
+                    writer.writerows(rows)
+                    num_rows += len(rows)
+        else:
+            with pq.ParquetWriter(str(out), schema) as writer:
+                for rows in chunks:
+                    columns = list(zip(*rows))
+                    writer.write_table(pa.Table.from_arrays(
+                        [pa.array(col, type=field.type)
+                         for col, field in zip(columns, schema)],
+                        schema=schema,
+                    ))
+                    num_rows += len(rows)
+
+    return num_rows
+
+
+def show_figure(name: str, publisher: Optional[WebhookPublisher] = None):
+    """Show current figure or upload it with publisher.
+    The figure is closed afterwards in both cases.
+    """
+    fig = plt.gcf()
+    if publisher:
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", bbox_inches="tight")
+        publisher.post_image(f"{name}.png", buf.getvalue())
+    else:
+        plt.show()
+    plt.close(fig)
+
+
+def plot_win_ratio_pies(map_stats_df: pd.DataFrame, pie_fmt_func: Callable,
+                        publisher: Optional[WebhookPublisher] = None):
     # Win ratio pie.
     axis_win_sum = map_stats_df["axis_win"].sum()
     allies_win_sum = map_stats_df["allies_win"].sum()
@@ -182,10 +637,11 @@ def plot_win_ratio_pies(map_stats_df: pd.DataFrame, pie_fmt_func: Callable):
         wedges,
         labels,
     )
-    plt.show()
+    show_figure("win_ratio", publisher)
 
 
-def plot_num_rounds_pie(map_stats_df: pd.DataFrame, pie_fmt_func: Callable):
+def plot_num_rounds_pie(map_stats_df: pd.DataFrame, pie_fmt_func: Callable,
+                        publisher: Optional[WebhookPublisher] = None):
     # Number of rounds per map pie.
     _, ax = plt.subplots(figsize=(10, 10))
 
@@ -216,11 +672,12 @@ def plot_num_rounds_pie(map_stats_df: pd.DataFrame, pie_fmt_func: Callable):
     start_dt = map_stats_df["match_datetime"].min().strftime("%d.%m.%Y")
     stop_dt = map_stats_df["match_datetime"].max().strftime("%d.%m.%Y")
     plt.title(f"Played rounds ({start_dt} - {stop_dt})")
-    plt.show()
+    show_figure("played_rounds", publisher)
 
 
 def plot_win_condition_pies(map_stats_df: pd.DataFrame, map_stats_grouped: pd.DataFrameGroupBy,
-                            pie_fmt_func: Callable):
+                            pie_fmt_func: Callable,
+                            publisher: Optional[WebhookPublisher] = None):
     # Top win conditions pies per map.
     for name, group in map_stats_grouped:
         print(f"plotting win condition pie for {name}")
@@ -286,27 +743,98 @@ def plot_win_condition_pies(map_stats_df: pd.DataFrame, map_stats_grouped: pd.Da
         start_dt = map_stats_df["match_datetime"].min().strftime("%d.%m.%Y")
         stop_dt = map_stats_df["match_datetime"].max().strftime("%d.%m.%Y")
         plt.suptitle(f"Win conditions for {name} ({start_dt} - {stop_dt})")
-        plt.show()
+        show_figure(f"{name}_win_conditions", publisher)
 
 
-# noinspection SqlNoDataSourceInspection
-def plot_win_ratios(map_stats_grouped: pd.DataFrameGroupedBy):
+def daily_map_stats(map_stats_df: pd.DataFrame,
+                    windows: Tuple[int, ...] = ROLLING_WINDOWS
+                    ) -> pd.DataFrame:
+    """Compute daily and rolling statistics for all maps at once.
+
+    Returns a tidy DataFrame with one row per map per day between the
+    map's first and last played day. games_played counts rounds won by
+    either Axis or Allies, rounds_played counts all rounds. Rolling
+    window columns have a suffix, e.g. axis_win_rate_7d.
+    """
+    metrics = ["games_played", "rounds_played",
+               "axis_win_rate", "mean_time_remaining"]
+    columns = ["date", "name"] + metrics + [
+        f"{m}_{w}d" for w in windows for m in metrics]
+    if map_stats_df.empty:
+        dtypes = {"date": "datetime64[ns]", "name": object}
+        for column in columns[2:]:
+            played = column.startswith(("games_played", "rounds_played"))
+            dtypes[column] = np.int64 if played else float
+        return pd.DataFrame({
+            column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()
+        })
+
+    counts = pd.DataFrame({
+        "rounds_played": 1,
+        "axis_wins": map_stats_df["axis_win"].astype(int),
+        "games_played": (map_stats_df["axis_win"]
+                         | map_stats_df["allies_win"]).astype(int),
+        "time_remaining": map_stats_df["time_remaining"],
+    }, index=map_stats_df.index)
+
+    date = map_stats_df["match_datetime"].dt.floor("1D").rename("date")
+    daily = counts.groupby([date, map_stats_df["name"]]).sum()
+
+    # One date x (metric, map) frame for all maps. Missing days
+    # are zero so that rolling windows are calendar based.
+    wide = daily.unstack("name", fill_value=0)
+    dates = pd.date_range(wide.index.min(), wide.index.max(),
+                          freq="1D", name="date")
+    wide = wide.reindex(dates, fill_value=0)
+    names = wide["games_played"].columns
+
+    frames = {"": wide}
+    for window in windows:
+        frames[f"_{window}d"] = wide.rolling(window, min_periods=1).sum()
+
+    tidy = {
+        "date": np.tile(dates.values, len(names)),
+        "name": np.repeat(names.values, len(dates)),
+    }
+    for suffix, frame in frames.items():
+        games = frame["games_played"][names].astype(np.int64)
+        rounds = frame["rounds_played"][names].astype(np.int64)
+        values = {
+            "games_played": games,
+            "rounds_played": rounds,
+            "axis_win_rate": (frame["axis_wins"][names]
+                              / games.where(games > 0)) * 100,
+            "mean_time_remaining": (frame["time_remaining"][names]
+                                    / rounds.where(rounds > 0)),
+        }
+        for metric, value in values.items():
+            # Column-major ravel matches the tile/repeat layout above.
+            tidy[f"{metric}{suffix}"] = value.to_numpy().T.ravel()
+
+    tidy = pd.DataFrame(tidy, columns=columns)
+
+    # Limit each map to its own played date range.
+    played_days = daily.index.to_frame(index=False).groupby("name")["date"]
+    first_day = tidy["name"].map(played_days.min())
+    last_day = tidy["name"].map(played_days.max())
+    in_range = (tidy["date"] >= first_day) & (tidy["date"] <= last_day)
+    return tidy.loc[in_range].reset_index(drop=True)
+
+
+def plot_win_ratios(daily_stats: pd.DataFrame,
+                    publisher: Optional[WebhookPublisher] = None):
     # Win ratio plots.
-    for name, group in map_stats_grouped:
+    for name, group in daily_stats.groupby("name"):
         print(f"plotting win ratio for: {name}")
-        group_ts = group.set_index("match_datetime")
-        group_ts_sum = group_ts.resample("1d").sum()
-
-        group_ts_sum["axis_win"] = group_ts_sum["axis_win"].astype(int)
-        group_ts_sum["allies_win"] = group_ts_sum["allies_win"].astype(int)
-        games_played = (group_ts_sum["axis_win"]
-                        + group_ts_sum["allies_win"]).astype(int)
-        # print(games_played)
-
-        axis_win_ratio = (group_ts_sum["axis_win"] / games_played) * 100
-
-        ax = sns.lineplot(axis_win_ratio.index, axis_win_ratio, marker="*",
-                          color="blue")
+        group = group.set_index("date")
+        games_played = group["games_played"].astype(int)
+        axis_win_ratio = group["axis_win_rate"]
+        axis_win_ratio_7d = group["axis_win_rate_7d"]
+
+        ax = sns.lineplot(x=axis_win_ratio.index, y=axis_win_ratio,
+                          marker="*", color="blue")
+        ax.plot(axis_win_ratio_7d.index, axis_win_ratio_7d,
+                linestyle="--", color="blue", alpha=0.5)
         ax.set_ylabel("Axis win ratio (%)", color="blue")
 
         ax2 = ax.twinx()
@@ -320,11 +848,18 @@ def plot_win_ratios(map_stats_grouped: pd.DataFrameGroupedBy):
 
         plt.title(name)
         plt.gcf().autofmt_xdate()
-        plt.show()
+        show_figure(f"{name}_win_ratio", publisher)
 
 
-def generate_report(thresh: int, days: int):
-    conn = get_conn()
+def generate_report(thresh: int, days: int,
+                    publisher: Optional[WebhookPublisher] = None,
+                    ci: Optional[str] = None,
+                    n_resamples: int = confidence.DEFAULT_RESAMPLES):
+    """Print and plot statistics for the last days. If publisher
+    is given, charts and summaries are uploaded with it instead
+    of being shown. If ci is given, win rates and win condition
+    shares include confidence intervals computed with that method.
+    """
     days = int(abs(days))
     thresh = int(abs(thresh))
 
@@ -333,28 +868,32 @@ def generate_report(thresh: int, days: int):
 
     sql_map_stats = f"""
     SELECT * FROM {MAP_STATS_TABLE}
-    WHERE DATETIME(match_datetime) >= DATETIME(?)
+    WHERE match_datetime >= ?
     AND players >= ?
     """
 
     sql_objectives = f"""
     SELECT * FROM {MAP_END_OBJECTIVES_TABLE}
-    WHERE DATETIME(match_datetime) >= DATETIME(?)
+    WHERE match_datetime >= ?
     """
 
     map_stats_params = (adjusted_date.isoformat(), thresh)
     objectives_params = (adjusted_date.isoformat(),)
 
-    with conn:
-        map_stats_df = pd.read_sql_query(
-            sql_map_stats, conn, params=map_stats_params)
-        objectives_df = pd.read_sql_query(
-            sql_objectives, conn, params=objectives_params)
-
-    objs_stats_df = map_stats_df.merge(
-        objectives_df,
-        on=["match_datetime", "server_id"],
-    )
+    with get_manager().read_conn() as conn:
+        # Read both tables from the same snapshot even if
+        # new matches are being inserted concurrently.
+        conn.execute("BEGIN")
+        try:
+            map_stats_df = pd.read_sql_query(
+                sql_map_stats, conn, params=map_stats_params)
+            objectives_df = pd.read_sql_query(
+                sql_objectives, conn, params=objectives_params)
+            details_since = objective_details_since(conn)
+        finally:
+            conn.rollback()
+
+    objective_matrices = build_objective_matrices(map_stats_df, objectives_df)
 
     map_stats_df["match_datetime"] = pd.to_datetime(
         map_stats_df["match_datetime"])
@@ -366,19 +905,36 @@ def generate_report(thresh: int, days: int):
         absolute = int(pct / 100. * np.sum(allvals))
         return "{:.1f}%\n({:d})".format(pct, absolute)
 
-    plot_win_ratio_pies(map_stats_df, _fmt)
-
-    # Remove duplicate columns.
-    objs_stats_df = objs_stats_df.loc[:, ~objs_stats_df.columns.duplicated()]
+    plot_win_ratio_pies(map_stats_df, _fmt, publisher)
 
     # Per-map statistics.
     map_stats_grouped = map_stats_df.groupby("name")
 
-    plot_win_condition_pies(map_stats_df, map_stats_grouped, _fmt)
+    plot_win_condition_pies(map_stats_df, map_stats_grouped, _fmt, publisher)
+
+    plot_num_rounds_pie(map_stats_df, _fmt, publisher)
+
+    daily_stats = daily_map_stats(map_stats_df)
+    daily_stats_grouped = daily_stats.groupby("name")
 
-    plot_num_rounds_pie(map_stats_df, _fmt)
+    plot_win_ratios(daily_stats, publisher)
 
-    plot_win_ratios(map_stats_grouped)
+    win_cis = None
+    cond_cis = None
+    if ci:
+        win_cis = confidence.win_rate_intervals(
+            map_stats_df, ci, n_resamples=n_resamples)
+        cond_cis = confidence.win_condition_intervals(
+            map_stats_df, ci, n_resamples=n_resamples)
+
+    if details_since is not None and adjusted_date < details_since:
+        note = (f"Note: map end objective details before "
+                f"{details_since.date()} were folded into monthly "
+                f"aggregates by database retention, objective "
+                f"statistics only include rounds since then.")
+        print(note)
+        if publisher:
+            publisher.post_text(note)
 
     for name, group in map_stats_grouped:
         games_played = group.shape[0]
@@ -387,85 +943,72 @@ def generate_report(thresh: int, days: int):
         allies_won = group.loc[group["winning_team"] == "Allies"]
         allies_won_count = allies_won.shape[0]
 
-        print(name, games_played, "games played")
-        print("Allies won", allies_won_count,
-              f"({round(allies_won_count / games_played, 3):.1%})")
-        print("Axis won", axis_won_count,
-              f"({round(axis_won_count / games_played, 3):.1%})")
+        summary = [
+            f"{name} {games_played} games played",
+            f"Allies won {allies_won_count} "
+            f"({round(allies_won_count / games_played, 3):.1%})",
+            f"Axis won {axis_won_count} "
+            f"({round(axis_won_count / games_played, 3):.1%})",
+        ]
+
+        if win_cis is not None:
+            summary.append("Allies win rate " + confidence.format_interval(
+                win_cis.loc[name, "ci_low"], win_cis.loc[name, "ci_high"]))
 
-        print("---")
-        print("Axis reinforcements on round end:")
+        summary.append("---")
+        summary.append("Axis reinforcements on round end:")
         axis_rein = group["axis_reinforcements"].describe().astype(int).to_dict()
         del axis_rein["count"]
-        pprint(axis_rein)
+        summary.append(pformat(axis_rein))
 
-        print("---")
-        print("Allies reinforcements on round end:")
+        summary.append("---")
+        summary.append("Allies reinforcements on round end:")
         allies_rein = group["allies_reinforcements"].describe().astype(int).to_dict()
         del allies_rein["count"]
-        pprint(allies_rein)
-
-        print("---")
-        print("Top 3 win conditions:")
-        pprint(group["win_condition"].value_counts().nlargest(3).to_dict())
-
-        print("---")
-        print("Top 3 hottest objectives on round end:")
-        no_allcaps = objs_stats_df[
-            (objs_stats_df["win_condition"] != "ROWC_AllObjectiveCaptured")
-            & (objs_stats_df["name"] == name)
-            ]
-        pprint(no_allcaps["obj_name"].value_counts().nlargest(3).to_dict())
+        summary.append(pformat(allies_rein))
+
+        summary.append("---")
+        summary.append("Top 3 win conditions:")
+        summary.append(pformat(
+            group["win_condition"].value_counts().nlargest(3).to_dict()))
+        if cond_cis is not None:
+            top_conds = cond_cis.loc[name].nlargest(3, "count")
+            for cond, row in top_conds.iterrows():
+                summary.append(f"{cond}: {row['share']:.1%} "
+                               + confidence.format_interval(
+                                   row["ci_low"], row["ci_high"]))
+
+        summary.append("---")
+        summary.append("Top 3 hottest objectives on round end:")
+        matrix = objective_matrices[name]
+        no_allcaps = matrix.match_mask(
+            exclude_win_condition="ROWC_AllObjectiveCaptured")
+        summary.append(pformat(matrix.hottest(3, no_allcaps).to_dict()))
 
         # Ignore Supremacy maps for objective statistics.
         if not name[2:].lower().startswith("su"):
-            with pd.option_context("display.max_rows", None,
-                                   "display.max_columns", None,
-                                   "display.width", 500):
-                asd = objs_stats_df.loc[
-                    objs_stats_df["match_datetime"].isin(group["match_datetime"])
-                    & objs_stats_df["server_id"].isin(group["server_id"])
-                    ]
-                # print(asd)
-                grouped_x = asd.groupby(["match_datetime", "server_id"])
-                # for xname, xgroup in grouped_x:
-                #    print(xgroup["obj_name"].value_counts())
-
-                # print(grouped_by_match.size().droplevel(
-                #     level="match_datetime").droplevel("server_id").index.value_counts())
-                # print(grouped_by_match.size().index.get_level_values("obj_name"))
-
-                # for mname, mgroup in grouped_by_match:
-                #     print(mname)
-                #     print(mgroup)
-                #     print("*" * 10)
-
-            # for mname, mgroup in grouped_by_match:
-            #     print("-" * 20)
-
-            # nlargest_objs = group["obj_name"].value_counts().nlargest(3)
-            # print(nlargest_objs.to_dict())
-            #
-            # nlargest_df = group.loc[group["obj_name"].isin(nlargest_objs.index)]
-            # print(nlargest_df)
-            #
-            # print("----")
-            #
-            # nlargest_grouped = nlargest_df.groupby(["match_datetime", "server_id"])
-            # for nname, ngroup in nlargest_grouped:
-            #     print(nname)
-            #     print(ngroup)
-
-            print("*" * 100)
-
-        group_ts = group.set_index("match_datetime")
-        group_ts_mean = group_ts.resample("1d").mean()
-        time_remaining = group_ts_mean["time_remaining"]
+            time_limit = matrix.match_mask(win_condition="ROWC_TimeLimit")
+            summary.append("---")
+            summary.append("Top 3 hottest objectives on time limit:")
+            summary.append(pformat(matrix.hottest(3, time_limit).to_dict()))
+
+            if len(matrix.objectives):
+                summary.append("---")
+                summary.append("Objective holders on round end:")
+                summary.append(matrix.holder_counts().to_string())
+
+        summary = "\n".join(summary)
+        print(summary)
+        if publisher:
+            publisher.post_text(summary, code_block=True)
+
+        daily_group = daily_stats_grouped.get_group(name).set_index("date")
+        time_remaining = daily_group["mean_time_remaining"]
         ax = sns.lineplot(marker="*", data=time_remaining)
         ax.set_title(name)
         ax.set_ylabel("mean time remaining (s)")
 
         plt.gcf().autofmt_xdate()
-        plt.show()
+        show_figure(f"{name}_time_remaining", publisher)
 
     return map_stats_df
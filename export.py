@@ -0,0 +1,90 @@
+"""Export map statistics from the database to CSV or Parquet."""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import sys
+from pathlib import Path
+
+import db
+
+
+def parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser()
+
+    ap.add_argument(
+        "database",
+        help="path to database file",
+    )
+    ap.add_argument(
+        "out",
+        help="output file",
+    )
+    ap.add_argument(
+        "--format",
+        choices=db.EXPORT_FORMATS,
+        help="output file format (default=inferred from output file suffix)",
+    )
+    ap.add_argument(
+        "--start",
+        type=datetime.datetime.fromisoformat,
+        help="only export rounds played on or after this "
+             "ISO 8601 date or datetime",
+    )
+    ap.add_argument(
+        "--end",
+        type=datetime.datetime.fromisoformat,
+        help="only export rounds played before this "
+             "ISO 8601 date or datetime",
+    )
+    ap.add_argument(
+        "--server-id",
+        help="only export rounds from this server",
+    )
+    ap.add_argument(
+        "--chunk-size",
+        type=int,
+        default=db.DEFAULT_EXPORT_CHUNK_SIZE,
+        help="number of rows read from the database "
+             "at a time (default=%(default)s)",
+    )
+
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    db_path = Path(args.database)
+    out = Path(args.out)
+
+    if not db_path.exists():
+        print(f"database '{db_path.absolute()}' does not exist",
+              file=sys.stderr)
+        sys.exit(1)
+
+    fmt = args.format
+    if not fmt:
+        fmt = "parquet" if out.suffix.lower() == ".parquet" else "csv"
+
+    db.open_db(db_path)
+    try:
+        print(f"exporting to '{out.absolute()}'")
+        num_rows = db.export_map_stats(
+            out,
+            fmt=fmt,
+            start=args.start,
+            end=args.end,
+            server_id=args.server_id,
+            chunk_size=max(1, args.chunk_size),
+        )
+        print(f"exported {num_rows} rows")
+    except RuntimeError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
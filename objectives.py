@@ -0,0 +1,128 @@
+"""Dense per-map objective state for fast objective analytics."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+MATCH_KEY = ["name", "match_datetime", "server_id"]
+OBJECTIVE_KEY = ["map_name", "match_datetime", "server_id"]
+NOT_ACTIVE = -1
+
+
+@dataclass
+class ObjectiveMatrix:
+    """Map end objective state of a single map as a match x objective
+    matrix. holder_codes holds the index of the final holder in holders
+    for every objective active on round end and NOT_ACTIVE otherwise.
+    """
+    map_name: str
+    matches: pd.DataFrame
+    objectives: np.ndarray
+    holders: np.ndarray
+    holder_codes: np.ndarray
+
+    @property
+    def active(self) -> np.ndarray:
+        return self.holder_codes != NOT_ACTIVE
+
+    def match_mask(self, win_condition: Optional[str] = None,
+                   exclude_win_condition: Optional[str] = None,
+                   winning_team: Optional[str] = None) -> np.ndarray:
+        """Boolean mask of matches fulfilling all given conditions."""
+        mask = np.ones(len(self.matches), dtype=bool)
+        if win_condition is not None:
+            mask &= (self.matches["win_condition"] == win_condition).to_numpy()
+        if exclude_win_condition is not None:
+            mask &= (self.matches["win_condition"]
+                     != exclude_win_condition).to_numpy()
+        if winning_team is not None:
+            mask &= (self.matches["winning_team"] == winning_team).to_numpy()
+        return mask
+
+    def active_counts(self, mask: Optional[np.ndarray] = None) -> pd.Series:
+        """Number of matches each objective was active on round end."""
+        active = self.active if mask is None else self.active[mask]
+        return pd.Series(active.sum(axis=0), index=self.objectives)
+
+    def hottest(self, n: int = 3, mask: Optional[np.ndarray] = None
+                ) -> pd.Series:
+        counts = self.active_counts(mask)
+        return counts[counts > 0].nlargest(n)
+
+    def holder_counts(self, mask: Optional[np.ndarray] = None
+                      ) -> pd.DataFrame:
+        """Number of matches each objective was held by each holder
+        on round end, objectives as rows and holders as columns.
+        """
+        codes = self.holder_codes if mask is None else self.holder_codes[mask]
+        counts = np.zeros((len(self.objectives), len(self.holders)),
+                          dtype=np.int64)
+        for i in range(len(self.holders)):
+            counts[:, i] = (codes == i).sum(axis=0)
+        return pd.DataFrame(counts, index=self.objectives,
+                            columns=self.holders)
+
+
+def build_objective_matrices(map_stats_df: pd.DataFrame,
+                             objectives_df: pd.DataFrame
+                             ) -> Dict[str, ObjectiveMatrix]:
+    """Build objective matrices for all maps at once.
+
+    map_stats_df rows are matches, objectives_df rows are map end
+    objectives as stored in the database. Both are joined on map name,
+    match datetime and server ID. Placeholder rows of matches without
+    objective information are ignored.
+    """
+    matches = map_stats_df.sort_values(MATCH_KEY).reset_index(drop=True)
+    match_index = pd.MultiIndex.from_frame(matches[MATCH_KEY])
+    match_row = matches.groupby("name").cumcount().to_numpy()
+
+    objs = objectives_df[objectives_df["obj_index"].notna()]
+    global_row = match_index.get_indexer(
+        pd.MultiIndex.from_frame(objs[OBJECTIVE_KEY]))
+    objs = objs[global_row >= 0]
+    global_row = global_row[global_row >= 0]
+
+    # Column of each objective within its map's matrix.
+    obj_columns = (objs[["map_name", "obj_name"]]
+                   .drop_duplicates()
+                   .sort_values(["map_name", "obj_name"]))
+    obj_columns["column"] = obj_columns.groupby("map_name").cumcount()
+    column = objs[["map_name", "obj_name"]].merge(
+        obj_columns, on=["map_name", "obj_name"], how="left",
+    )["column"].to_numpy()
+
+    holder_codes, holders = pd.factorize(objs["holder"].fillna(""), sort=True)
+    holders = np.asarray(holders)
+    map_names = objs["map_name"].to_numpy()
+    rows = match_row[global_row]
+
+    ret: Dict[str, ObjectiveMatrix] = {}
+    match_positions_by_map = matches.groupby("name").indices
+    obj_positions = pd.Series(np.arange(len(objs))).groupby(map_names).indices
+    obj_names = {
+        name: group.to_numpy()
+        for name, group in obj_columns.groupby("map_name")["obj_name"]
+    }
+
+    for name, match_positions in match_positions_by_map.items():
+        objectives = obj_names.get(name, np.array([], dtype=object))
+        codes = np.full((len(match_positions), len(objectives)),
+                        NOT_ACTIVE, dtype=np.int16)
+        positions = obj_positions.get(name)
+        if positions is not None:
+            codes[rows[positions], column[positions]] = holder_codes[positions]
+        ret[name] = ObjectiveMatrix(
+            map_name=name,
+            matches=matches.iloc[match_positions].reset_index(drop=True),
+            objectives=objectives,
+            holders=holders,
+            holder_codes=codes,
+        )
+
+    return ret
@@ -5,6 +5,7 @@ import concurrent.futures as futures
 import csv
 import datetime
 import glob
+import locale
 import os
 import platform
 import re
@@ -17,9 +18,12 @@ from typing import Tuple
 
 import pandas as pd
 
+import confidence
 import db
 from mapstats import MapStats
+from webhook import WebhookPublisher
 
+LOG_ENCODING = locale.getpreferredencoding(False)
 LOG_FILE_OPEN_DT_FMT = "%m/%d/%y %H:%M:%S"
 LOG_FILE_OPEN_PAT = re.compile(
     r"^Log:\sLog\sfile\sopen,\s([0-9]+/[0-9]+/[0-9]+\s[0-9]+:[0-9]+:[0-9]+)$"
@@ -99,11 +103,45 @@ def parse_args() -> argparse.Namespace:
         "--database",
         help="path to database file",
     )
+    ap.add_argument(
+        "--retention-months",
+        type=int,
+        metavar="N",
+        help="fold map end objective details older than N months "
+             "into monthly per-map aggregates and compact the database. "
+             "Compaction only releases disk space in databases using "
+             "incremental auto vacuum, older databases need a one-time "
+             "--enable-incremental-vacuum first",
+    )
+    ap.add_argument(
+        "--enable-incremental-vacuum",
+        action="store_true",
+        default=False,
+        help="convert an existing database to incremental auto vacuum "
+             "with a one-time full VACUUM, which rewrites the whole "
+             "database file and blocks writes while running",
+    )
     ap.add_argument(
         "--discord-webhook",
         help="Discord webhook URL to post the report to "
              "if --report-days argument is used",
     )
+    ap.add_argument(
+        "--confidence-interval",
+        dest="ci",
+        choices=confidence.CI_METHODS,
+        help="include confidence intervals for win rates and "
+             "win condition shares, computed with the given method "
+             "(wilson is recommended for maps with few rounds)",
+    )
+    ap.add_argument(
+        "--bootstrap-resamples",
+        type=int,
+        default=confidence.DEFAULT_RESAMPLES,
+        metavar="N",
+        help="number of resamples for bootstrap confidence "
+             "intervals (default=%(default)s)",
+    )
     ap.add_argument(
         "--server-id",
         default="",
@@ -184,6 +222,22 @@ def parse_match_stack(stack: List[Tuple[re.Pattern, re.Match]]
 
 def parse_stats(log: Path, server_id: Optional[str] = None
                 ) -> List[MapStats]:
+    return parse_stats_from(log, server_id, at_eof=True)[0]
+
+
+def parse_stats_from(log: Path, server_id: Optional[str] = None,
+                     offset: int = 0, at_eof: bool = False
+                     ) -> Tuple[List[MapStats], int]:
+    """Parse balance stats from log starting at byte offset.
+
+    Returns parsed stats and the byte offset to resume parsing from
+    once the log has grown. The resume offset never points inside an
+    unfinished balance stats sequence or a partially written line.
+
+    A last line without a line break is treated as still being
+    written and left for the next call, unless at_eof is set
+    because the log is complete.
+    """
     ret: List[MapStats] = []
 
     if server_id is None:
@@ -192,31 +246,46 @@ def parse_stats(log: Path, server_id: Optional[str] = None
 
     stack = []
     flag = False
+    resume_offset = offset
 
     try:
-        with log.open("r") as f:
-            first_line = f.readline()
-            match = LOG_FILE_OPEN_PAT.match(first_line)
+        with log.open("rb") as f:
+            first_line = f.readline().decode(LOG_ENCODING, errors="replace")
+            match = LOG_FILE_OPEN_PAT.match(first_line.rstrip("\r\n"))
             if not match:
                 print(f"error: no log file open time stamp in "
                       f"'{log.absolute()}'", file=sys.stderr)
-                return ret
+                return ret, offset
 
             log_open_dt = datetime.datetime.strptime(
                 match.group(1), LOG_FILE_OPEN_DT_FMT)
 
-            for line in f:
+            pos = max(offset, f.tell())
+            f.seek(pos)
+            resume_offset = pos
+
+            for raw_line in f:
+                if not at_eof and not raw_line.endswith(b"\n"):
+                    # Line is still being written.
+                    break
+                pos += len(raw_line)
+                line = raw_line.decode(
+                    LOG_ENCODING, errors="replace").rstrip("\r\n")
+
                 if not flag:
                     m = NUM_PLAYERS_PAT.match(line)
                     if m:
                         # Found beginning of balance stats sequence.
                         flag = True
                         stack.append((NUM_PLAYERS_PAT, m))
+                    else:
+                        resume_offset = pos
                 else:
                     m = MATCH_STOP_PAT.match(line)
                     if m:
                         # Found end of balance stats sequence.
                         flag = False
+                        resume_offset = pos
                         stack.append((MATCH_STOP_PAT, m))
                         ms = parse_match_stack(stack)
                         if ms:
@@ -234,7 +303,7 @@ def parse_stats(log: Path, server_id: Optional[str] = None
     except EnvironmentError as e:
         print(f"error reading '{log.absolute()}': {repr(e)}",
               file=sys.stderr)
-    return ret
+    return ret, resume_offset
 
 
 def parse_logs(logs: List[Path], csv_out: Path,
@@ -265,7 +334,8 @@ def parse_logs(logs: List[Path], csv_out: Path,
     return stats
 
 
-def analyze_csv(csv_path: Path, thresh: int):
+def analyze_csv(csv_path: Path, thresh: int, ci: Optional[str] = None,
+                n_resamples: int = confidence.DEFAULT_RESAMPLES):
     print("analyzing statistics...")
     df = pd.read_csv(csv_path)
     df = df[df.loc[:, "players"] >= thresh]
@@ -282,6 +352,14 @@ def analyze_csv(csv_path: Path, thresh: int):
     print()
     print("win ratios:")
     grouped = df.groupby("name")
+    win_cis = None
+    cond_cis = None
+    if ci:
+        win_cis = confidence.win_rate_intervals(
+            df, ci, n_resamples=n_resamples)
+        cond_cis = confidence.win_condition_intervals(
+            df, ci, n_resamples=n_resamples)
+
     for name, group in grouped:
         num_axis_win = len(group[group.loc[:, "winning_team"] == "Axis"])
         num_allies_win = len(group[group.loc[:, "winning_team"] == "Allies"])
@@ -290,17 +368,30 @@ def analyze_csv(csv_path: Path, thresh: int):
             allies_win_rate = (num_allies_win / total_win)
         else:
             allies_win_rate = 0.0
+        ci_str = ""
+        if win_cis is not None:
+            ci_str = " " + confidence.format_interval(
+                win_cis.loc[name, "ci_low"], win_cis.loc[name, "ci_high"])
         print(
             f"\t{name}: num_axis_win={num_axis_win}, "
             f"num_allies_win={num_allies_win}, "
-            f"allies_win_rate={allies_win_rate:.1%}"
+            f"allies_win_rate={allies_win_rate:.1%}{ci_str}"
         )
 
     print()
     print("win conditions:")
     for name, group in grouped:
         value_counts = group.loc[:, "win_condition"].value_counts().to_dict()
-        value_counts = ",".join([f"{dk}={dv}" for dk, dv in value_counts.items()])
+        parts = []
+        for dk, dv in value_counts.items():
+            part = f"{dk}={dv}"
+            if cond_cis is not None:
+                cond_ci = cond_cis.loc[(name, dk)]
+                ci_str = confidence.format_interval(
+                    cond_ci["ci_low"], cond_ci["ci_high"])
+                part += f" ({cond_ci['share']:.1%} {ci_str})"
+            parts.append(part)
+        value_counts = ",".join(parts)
         print(f"\t{name}: {value_counts}")
 
     # advanced_out = Path(f"{out.name}_advanced_details").with_suffix(".txt")
@@ -337,16 +428,39 @@ def main():
     map_stats = parse_logs(logs, out, args.server_id)
 
     if analyze:
-        analyze_csv(out, thresh)
+        analyze_csv(out, thresh, args.ci, args.bootstrap_resamples)
 
     if args.database:
         db.insert_map_stats(map_stats)
+        if args.enable_incremental_vacuum:
+            print("converting database to incremental auto vacuum")
+            db.enable_incremental_vacuum()
+        if args.retention_months is not None:
+            removed = db.apply_retention(args.retention_months)
+            print(f"folded {removed} objective rows older than "
+                  f"{args.retention_months} months into aggregates")
+            if not db.compact_db():
+                print("database does not use incremental auto vacuum, "
+                      "free pages were not released, see "
+                      "--enable-incremental-vacuum")
         if gen_report and db_path:
             print(
                 f"generating report from database '{db_path.absolute()}' "
                 f"with player threshold '{thresh}' for the last '{gen_report}' days"
             )
-            report = db.generate_report(thresh, days=gen_report)
+            if args.discord_webhook:
+                with WebhookPublisher(args.discord_webhook) as publisher:
+                    report = db.generate_report(
+                        thresh, days=gen_report, publisher=publisher,
+                        ci=args.ci, n_resamples=args.bootstrap_resamples)
+                    print("waiting for webhook uploads to finish...")
+                if publisher.errors:
+                    print(f"{len(publisher.errors)} webhook upload(s) failed",
+                          file=sys.stderr)
+            else:
+                report = db.generate_report(
+                    thresh, days=gen_report,
+                    ci=args.ci, n_resamples=args.bootstrap_resamples)
             # print(report)
 
 
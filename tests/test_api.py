@@ -0,0 +1,175 @@
+import asyncio
+import datetime
+import tempfile
+import unittest
+from http import HTTPStatus
+from pathlib import Path
+
+import api
+import db
+from mapstats import MapStats
+
+
+def map_stats(name: str, winning_team: str, win_condition: str,
+              days_ago: float) -> MapStats:
+    return MapStats(
+        name=name,
+        players=32,
+        winning_team=winning_team,
+        time_remaining=120,
+        teams_swapped=False,
+        axis_reinforcements=10,
+        allies_reinforcements=-1,
+        win_condition=win_condition,
+        axis_team_score=10,
+        allies_team_score=5,
+        active_objectives=[("0", "Obj A", "Axis"), ("1", "Obj B", "Allies")],
+        server_id="",
+        match_datetime=(datetime.datetime.now()
+                        - datetime.timedelta(days=days_ago)),
+    )
+
+
+class StatsServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "stats.db"
+        db.init_db(self.db_path)
+        db.close_db()
+        self.server = None
+
+    def tearDown(self):
+        if self.server:
+            self.server.close()
+        db.close_db()
+        self.tmp.cleanup()
+
+    def _populate(self):
+        db.init_db(self.db_path)
+        db.insert_map_stats([
+            map_stats("VNTE-Hue", "Axis", "ROWC_TimeLimit", 1.5),
+            map_stats("VNTE-Hue", "Allies", "ROWC_AllObjectiveCaptured", 1),
+            map_stats("VNTE-Hue", "Axis", "ROWC_TimeLimit", 0.5),
+            map_stats("VNSU-AnLao", "Allies", "ROWC_MoraleDefeat", 2),
+            map_stats("VNTE-Hue", "Axis", "ROWC_TimeLimit", 60),
+        ])
+        db.close_db()
+
+    def _start(self, cache_ttl: float = api.DEFAULT_CACHE_TTL):
+        self.server = api.StatsServer(db.open_db(self.db_path),
+                                      cache_ttl=cache_ttl)
+
+    def _get(self, target: str):
+        return asyncio.run(self.server._dispatch("GET", target))
+
+    def test_empty_database(self):
+        self._start()
+        for route in self.server.routes:
+            status, body = self._get(route)
+            self.assertEqual(status, HTTPStatus.OK, route)
+            if route == "/objectives/hottest":
+                self.assertEqual(body["data"]["objectives"], [])
+            else:
+                self.assertEqual(body["data"], [], route)
+
+    def test_win_rates(self):
+        self._populate()
+        self._start()
+        status, body = self._get("/maps/win-rates?days=30")
+        self.assertEqual(status, HTTPStatus.OK)
+        hue, anlao = body["data"]
+        self.assertEqual(hue["name"], "VNTE-Hue")
+        self.assertEqual(hue["games_played"], 3)
+        self.assertEqual(hue["axis_wins"], 2)
+        self.assertAlmostEqual(hue["axis_win_rate"], 2 / 3)
+        self.assertEqual(anlao["allies_win_rate"], 1.0)
+
+    def test_win_conditions(self):
+        self._populate()
+        self._start()
+        status, body = self._get("/maps/win-conditions")
+        self.assertEqual(status, HTTPStatus.OK)
+        counts = {(row["name"], row["win_condition"]): row["count"]
+                  for row in body["data"]}
+        self.assertEqual(counts, {
+            ("VNSU-AnLao", "ROWC_MoraleDefeat"): 1,
+            ("VNTE-Hue", "ROWC_AllObjectiveCaptured"): 1,
+            ("VNTE-Hue", "ROWC_TimeLimit"): 2,
+        })
+
+    def test_hottest_objectives(self):
+        self._populate()
+        self._start()
+        status, body = self._get("/objectives/hottest?n=1")
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertIsNone(body["data"]["objective_details_since"])
+        hottest = {row["name"]: (row["obj_name"], row["count"])
+                   for row in body["data"]["objectives"]}
+        # Rounds won by capturing all objectives are not counted.
+        self.assertEqual(hottest, {
+            "VNSU-AnLao": ("Obj A", 1),
+            "VNTE-Hue": ("Obj A", 2),
+        })
+
+    def test_daily(self):
+        self._populate()
+        self._start()
+        status, body = self._get("/daily?days=7")
+        self.assertEqual(status, HTTPStatus.OK)
+        hue = [row for row in body["data"] if row["name"] == "VNTE-Hue"]
+        self.assertEqual(sum(row["rounds_played"] for row in hue), 3)
+        self.assertEqual(hue[-1]["rounds_played_7d"], 3)
+        for row in hue:
+            datetime.date.fromisoformat(row["date"])
+
+    def test_bad_days(self):
+        self._start()
+        for days in ("abc", str(api.MAX_DAYS + 1), "1000000000"):
+            status, body = self._get(f"/maps/win-rates?days={days}")
+            self.assertEqual(status, HTTPStatus.BAD_REQUEST, days)
+            self.assertIn("days", body["error"])
+
+    def test_not_found(self):
+        self._start()
+        status, _ = self._get("/nope")
+        self.assertEqual(status, HTTPStatus.NOT_FOUND)
+        status, body = self._get("/")
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(body["endpoints"], sorted(self.server.routes))
+
+    def test_cache(self):
+        self._populate()
+        self._start(cache_ttl=60.0)
+        _, first = self._get("/maps/win-rates")
+        _, second = self._get("/maps/win-rates")
+        self.assertIs(first["data"], second["data"])
+
+        _, other = self._get("/maps/win-rates?days=7")
+        self.assertIsNot(first["data"], other["data"])
+
+    def test_cache_expires(self):
+        self._start(cache_ttl=0.0)
+        _, first = self._get("/maps/win-rates")
+        _, second = self._get("/maps/win-rates")
+        self.assertIsNot(first["data"], second["data"])
+
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "stats.db"
+        db.init_db(self.db_path)
+        db.close_db()
+        self.manager = db.open_db(self.db_path)
+
+    def tearDown(self):
+        db.close_db()
+        self.tmp.cleanup()
+
+    def test_daily_empty_database(self):
+        with self.manager.read_conn() as conn:
+            self.assertEqual(api.query_daily(conn, 30, 0), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
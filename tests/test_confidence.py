@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import confidence
+
+
+class ConfidenceTest(unittest.TestCase):
+    def test_bootstrap_extreme_proportions_use_wilson(self):
+        successes = np.array([0, 2, 1])
+        totals = np.array([2, 2, 2])
+        lo, hi = confidence.bootstrap_interval(
+            successes, totals, n_resamples=2000, seed=1)
+        w_lo, w_hi = confidence.wilson_interval(successes, totals)
+
+        np.testing.assert_allclose(lo[:2], w_lo[:2])
+        np.testing.assert_allclose(hi[:2], w_hi[:2])
+        self.assertTrue((hi - lo > 0).all())
+
+    def test_bootstrap_bounds_contain_estimate(self):
+        successes = np.array([0, 5, 10])
+        totals = np.array([10, 10, 10])
+        lo, hi = confidence.bootstrap_interval(
+            successes, totals, n_resamples=2000, seed=1, workers=1)
+        self.assertTrue((lo <= successes / totals + 1e-12).all())
+        self.assertTrue((hi >= successes / totals - 1e-12).all())
+        self.assertGreater(hi[0], 0.0)
+        self.assertLess(lo[2], 1.0)
+
+    def test_zero_totals_are_nan(self):
+        lo, hi = confidence.bootstrap_interval(
+            np.array([0]), np.array([0]), n_resamples=100, seed=1)
+        self.assertTrue(np.isnan(lo[0]) and np.isnan(hi[0]))
+        self.assertEqual(confidence.format_interval(lo[0], hi[0]), "[n/a]")
+
+    def test_win_rate_intervals(self):
+        df = pd.DataFrame({
+            "name": ["VNTE-Hue", "VNTE-Hue", "VNSU-AnLao"],
+            "winning_team": ["Axis", "Axis", None],
+        })
+        cis = confidence.win_rate_intervals(df, "bootstrap", n_resamples=500)
+        self.assertEqual(cis.loc["VNTE-Hue", "num_axis_win"], 2)
+        self.assertEqual(cis.loc["VNTE-Hue", "ci_low"], 0.0)
+        self.assertGreater(cis.loc["VNTE-Hue", "ci_high"], 0.0)
+        self.assertTrue(np.isnan(cis.loc["VNSU-AnLao", "ci_low"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import gc
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+import db
+
+
+class ConnectionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "stats.db"
+
+    def tearDown(self):
+        db.close_db()
+        self.tmp.cleanup()
+
+    def _run_in_thread(self, func, timeout=5.0):
+        result = {}
+
+        def target():
+            try:
+                result["value"] = func()
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        self.assertFalse(thread.is_alive(), "thread did not finish")
+        return result
+
+    def test_thread_connections_closed_on_thread_exit(self):
+        manager = db.ConnectionManager(self.db_path)
+        conns = []
+
+        def worker():
+            conn = manager.get_conn()
+            conn.execute("SELECT 1")
+            conns.append(conn)
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gc.collect()
+
+        self.assertEqual(manager._conns, [])
+        for conn in conns:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+        manager.close()
+
+    def test_reader_not_blocked_by_write_transaction(self):
+        db.init_db(self.db_path)
+        conn = db.get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            f"INSERT INTO {db.MAP_STATS_TABLE} (name, match_datetime, "
+            f"server_id) VALUES ('VNTE-Hue', '2020-01-01T00:00:00', '')")
+
+        start = time.monotonic()
+        with db.get_manager().read_conn() as reader:
+            count = reader.execute(
+                f"SELECT COUNT(*) FROM {db.MAP_STATS_TABLE}").fetchone()[0]
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(count, 0)
+
+        conn.commit()
+        with db.get_manager().read_conn() as reader:
+            count = reader.execute(
+                f"SELECT COUNT(*) FROM {db.MAP_STATS_TABLE}").fetchone()[0]
+        self.assertEqual(count, 1)
+
+    def test_set_manager_and_close_db(self):
+        first = db.init_db(self.db_path)
+        second = db.ConnectionManager(self.db_path)
+
+        self.assertIs(db.set_manager(second), first)
+        self.assertIs(db.get_manager(), second)
+        with second.read_conn() as conn:
+            conn.execute("SELECT 1")
+
+        db.close_db()
+        with self.assertRaises(RuntimeError):
+            db.get_manager()
+        with self.assertRaises(RuntimeError):
+            with second.read_conn():
+                pass
+
+        # The replaced manager was not closed by set_manager.
+        with first.read_conn() as conn:
+            conn.execute("SELECT 1")
+        first.close()
+
+    def test_read_pool_exhaustion(self):
+        db.init_db(self.db_path, read_pool_size=1)
+        manager = db.get_manager()
+        borrowed = threading.Event()
+
+        def borrow():
+            with manager.read_conn() as conn:
+                borrowed.set()
+                return conn
+
+        with manager.read_conn() as first:
+            thread = threading.Thread(target=borrow, daemon=True)
+            thread.start()
+            # The only pooled connection is in use.
+            self.assertFalse(borrowed.wait(0.2))
+        thread.join(5.0)
+        self.assertTrue(borrowed.is_set())
+
+        with manager.read_conn() as conn:
+            self.assertIs(conn, first)
+
+    def test_failed_opens_do_not_exhaust_pool(self):
+        manager = db.ConnectionManager(
+            self.db_path, read_pool_size=2, read_only=True)
+
+        def read():
+            with manager.read_conn() as conn:
+                return conn.execute("SELECT 1").fetchone()[0]
+
+        for _ in range(3):
+            result = self._run_in_thread(read)
+            self.assertIsInstance(result.get("error"),
+                                  sqlite3.OperationalError)
+
+        db.init_db(self.db_path)
+        db.close_db()
+        self.assertEqual(self._run_in_thread(read).get("value"), 1)
+        manager.close()
+
+    def test_close_wakes_pool_waiters(self):
+        manager = db.init_db(self.db_path, read_pool_size=1)
+        result = {}
+
+        def wait_for_conn():
+            try:
+                with manager.read_conn():
+                    pass
+            except RuntimeError as e:
+                result["error"] = e
+
+        with manager.read_conn():
+            thread = threading.Thread(target=wait_for_conn, daemon=True)
+            thread.start()
+            time.sleep(0.1)
+            manager.close()
+        thread.join(5.0)
+
+        self.assertFalse(thread.is_alive())
+        self.assertIsInstance(result.get("error"), RuntimeError)
+        with self.assertRaises(RuntimeError):
+            with manager.read_conn():
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import daemon
+import db
+import parse
+
+HEADER = "Log: Log file open, 03/29/20 00:21:00\n"
+ROTATED_HEADER = "Log: Log file open, 03/30/20 00:21:00\n"
+
+
+def match_lines(t: float, name: str = "VNTE-Hue") -> str:
+    lines = [
+        f"BALANCE STATS: {name} | x | 32 players playing",
+        "BALANCE STATS: WinningTeam=Axis Teams Swapped= False",
+        "BALANCE STATS: TimeRemaining=120 foo",
+        "BALANCE STATS: AxisReinforcements=10 AlliesReinforcements=-1 x",
+        "xx ActiveObjectives 0 = Obj A Status=Axis",
+        "xx ActiveObjectives 1 = Obj B Status=Allies",
+        "BALANCE STATS: Win Condition ROWC_TimeLimit x",
+        "xx AxisTeamScore=10.0 AlliesTeamScore=5.0",
+    ]
+    return "".join(f"[{t:.2f}] DevBalanceStats: {line}\n" for line in lines)
+
+
+class ParseStatsFromTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = Path(self.tmp.name) / "Launch.log"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, text: str, mode: str = "w"):
+        with self.log.open(mode, newline="") as f:
+            f.write(text)
+
+    def test_complete_log(self):
+        self._write(HEADER + match_lines(10.0) + match_lines(20.0))
+        stats, offset = parse.parse_stats_from(self.log)
+        self.assertEqual([s.name for s in stats], ["VNTE-Hue", "VNTE-Hue"])
+        self.assertEqual(offset, self.log.stat().st_size)
+
+        stats, offset = parse.parse_stats_from(self.log, offset=offset)
+        self.assertEqual(stats, [])
+        self.assertEqual(offset, self.log.stat().st_size)
+
+    def test_resume_half_written_match(self):
+        lines = match_lines(10.0)
+        split = lines.index("TimeRemaining") + 5
+        self._write(HEADER + lines[:split])
+
+        stats, offset = parse.parse_stats_from(self.log)
+        self.assertEqual(stats, [])
+        # Resume from the start of the unfinished sequence.
+        self.assertEqual(offset, len(HEADER))
+
+        self._write(lines[split:] + match_lines(20.0), mode="a")
+        stats, offset = parse.parse_stats_from(self.log, offset=offset)
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(stats[0].time_remaining, 120)
+        self.assertEqual(offset, self.log.stat().st_size)
+
+        stats, _ = parse.parse_stats_from(self.log, offset=offset)
+        self.assertEqual(stats, [])
+
+    def test_unterminated_last_line(self):
+        self._write(HEADER + match_lines(10.0) + match_lines(20.0)[:-1])
+
+        stats, offset = parse.parse_stats_from(self.log)
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(offset, len(HEADER) + len(match_lines(10.0)))
+
+        stats, _ = parse.parse_stats_from(self.log, at_eof=True)
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(len(parse.parse_stats(self.log)), 2)
+
+    def test_missing_header(self):
+        self._write(match_lines(10.0))
+        stats, offset = parse.parse_stats_from(self.log, offset=5)
+        self.assertEqual(stats, [])
+        self.assertEqual(offset, 5)
+
+
+class DaemonIngestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_dir = Path(self.tmp.name) / "logs"
+        self.log_dir.mkdir()
+        self.log = self.log_dir / "Launch.log"
+        self.db_path = Path(self.tmp.name) / "stats.db"
+        self.daemon = daemon.Daemon(self.db_path, [self.log_dir], workers=1)
+        db.init_db(self.db_path)
+        self.daemon._start_executor()
+
+    def tearDown(self):
+        self.daemon._executor.shutdown(wait=True)
+        db.close_db()
+        self.tmp.cleanup()
+
+    def _write(self, text: str, mode: str = "w"):
+        with self.log.open(mode, newline="") as f:
+            f.write(text)
+
+    def _count_rounds(self) -> int:
+        conn = sqlite3.connect(str(self.db_path))
+        try:
+            return conn.execute(
+                f"SELECT COUNT(*) FROM {db.MAP_STATS_TABLE}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_scan_skips_unchanged_files(self):
+        self._write(HEADER + match_lines(10.0))
+        self.assertEqual(self.daemon.ingest(), 1)
+        self.assertEqual(self.daemon.scan(), [])
+        self.assertEqual(self.daemon.ingest(), 0)
+
+    def test_growing_and_rotated_log(self):
+        lines = match_lines(10.0)
+        self._write(HEADER + lines[:len(lines) // 2])
+        self.assertEqual(self.daemon.ingest(), 0)
+
+        self._write(lines[len(lines) // 2:] + match_lines(20.0), mode="a")
+        self.assertEqual(self.daemon.ingest(), 2)
+        self.assertEqual(self._count_rounds(), 2)
+
+        # New log file at the same path, larger than the old one.
+        self._write(ROTATED_HEADER + "".join(
+            match_lines(t) for t in (10.0, 20.0, 30.0)))
+        (path, state), = self.daemon.scan()
+        self.assertEqual(state.offset, 0)
+        self.assertEqual(self.daemon.ingest(), 3)
+        self.assertEqual(self._count_rounds(), 5)
+
+    def test_truncated_log_same_header(self):
+        self._write(HEADER + match_lines(10.0) + match_lines(20.0))
+        self.assertEqual(self.daemon.ingest(), 2)
+
+        self._write(HEADER + match_lines(30.0))
+        (path, state), = self.daemon.scan()
+        self.assertEqual(state.offset, 0)
+        self.assertEqual(self.daemon.ingest(), 1)
+        self.assertEqual(self._count_rounds(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
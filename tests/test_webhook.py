@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import webhook
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            server.requests.append((time.monotonic(), body))
+            response = server.responses.pop(0) if server.responses else None
+        status, headers = response or (204, {})
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class WebhookPublisherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.responses = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        host, port = self.server.server_address
+        self.url = f"http://{host}:{port}/webhook"
+
+        self._backoff_base = webhook.BACKOFF_BASE
+        webhook.BACKOFF_BASE = 0.01
+
+    def tearDown(self):
+        webhook.BACKOFF_BASE = self._backoff_base
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_images_are_batched(self):
+        with webhook.WebhookPublisher(self.url) as publisher:
+            for i in range(25):
+                publisher.post_image(f"chart {i}.png", b"png")
+        self.assertEqual(publisher.errors, [])
+
+        files = sorted(body.count(b'name="files[')
+                       for _, body in self.server.requests)
+        self.assertEqual(files, [5, 10, 10])
+        self.assertTrue(all(b'filename="chart_' in body
+                            for _, body in self.server.requests))
+
+    def test_split_text_is_sent_in_order(self):
+        content = "".join(f"line {i}\n" for i in range(1000))
+        with webhook.WebhookPublisher(self.url) as publisher:
+            publisher.post_text(content)
+        self.assertEqual(publisher.errors, [])
+
+        received = "".join(json.loads(body)["content"]
+                           for _, body in self.server.requests)
+        self.assertGreater(len(self.server.requests), 1)
+        self.assertEqual(received, content)
+
+    def test_retry_after_429(self):
+        self.server.responses = [(429, {"Retry-After": "0.2"})]
+        with webhook.WebhookPublisher(self.url) as publisher:
+            publisher.post_text("hello")
+        self.assertEqual(publisher.errors, [])
+
+        (first, _), (second, body) = self.server.requests
+        self.assertGreaterEqual(second - first, 0.2)
+        self.assertEqual(json.loads(body)["content"], "hello")
+
+    def test_retry_server_error(self):
+        self.server.responses = [(502, {}), (503, {})]
+        with webhook.WebhookPublisher(self.url) as publisher:
+            publisher.post_text("hello")
+        self.assertEqual(publisher.errors, [])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_server_error_retries_exhausted(self):
+        self.server.responses = [(500, {})] * 3
+        with webhook.WebhookPublisher(self.url, max_retries=2) as publisher:
+            publisher.post_text("hello")
+        self.assertEqual(len(publisher.errors), 1)
+        self.assertIsInstance(publisher.errors[0], webhook.WebhookError)
+
+    def test_client_error_is_not_retried(self):
+        self.server.responses = [(400, {})]
+        with webhook.WebhookPublisher(self.url) as publisher:
+            publisher.post_text("hello")
+        self.assertEqual(len(publisher.errors), 1)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_rate_limit_remaining_blocks_requests(self):
+        self.server.responses = [(204, {
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset-After": "0.3",
+        })]
+        with webhook.WebhookPublisher(self.url) as publisher:
+            publisher.post_text("first")
+            # Let the first request finish before queuing the second.
+            time.sleep(0.1)
+            publisher.post_text("second")
+        self.assertEqual(publisher.errors, [])
+
+        (first, _), (second, _) = self.server.requests
+        self.assertGreaterEqual(second - first, 0.3)
+
+
+class SplitContentTest(unittest.TestCase):
+    def test_split_content(self):
+        chunks = webhook.split_content("a\n" * 10 + "b" * 25, limit=10)
+        self.assertTrue(all(len(c) <= 10 for c in chunks))
+        self.assertEqual("".join(chunks), "a\n" * 10 + "b" * 25)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,267 @@
+"""Non-blocking report publishing to Discord webhooks.
+
+Messages are uploaded by a small pool of worker threads so that
+report generation can continue while earlier charts are still
+being sent. Images are batched into multi-attachment messages.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import List
+from typing import Tuple
+
+MAX_ATTACHMENTS = 10
+MAX_CONTENT_LENGTH = 2000
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_TIMEOUT = 30.0
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+USER_AGENT = "rs2stats"
+
+# Message payload and attached files.
+Message = Tuple[dict, List[Tuple[str, bytes]]]
+
+
+class WebhookError(Exception):
+    pass
+
+
+def _encode_multipart(payload: dict, files: List[Tuple[str, bytes]]
+                      ) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts = [
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"payload_json\"\r\n"
+        f"Content-Type: application/json\r\n\r\n".encode("utf-8"),
+        json.dumps(payload).encode("utf-8"),
+        b"\r\n",
+    ]
+    for i, (filename, data) in enumerate(files):
+        parts.extend([
+            f"--{boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"files[{i}]\"; "
+            f"filename=\"{filename}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n".encode("utf-8"),
+            data,
+            b"\r\n",
+        ])
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def split_content(content: str, limit: int = MAX_CONTENT_LENGTH) -> List[str]:
+    """Split text into chunks of at most limit characters,
+    preferring line boundaries.
+    """
+    chunks = []
+    current = ""
+    for line in content.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def safe_filename(name: str) -> str:
+    return re.sub(r"[^\w.\-]", "_", name)
+
+
+class WebhookPublisher:
+    """Uploads text and images to a webhook with bounded parallelism.
+
+    Each post_text() call and each image batch is sent by one worker,
+    different ones may be delivered in any order.
+
+    Rate limit headers are respected for all workers. Failed requests
+    are retried with exponential backoff. Errors are collected and
+    reported by close().
+    """
+
+    def __init__(self, url: str, workers: int = DEFAULT_WORKERS,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.url = url
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="webhook")
+        self._futs: List[Future] = []
+        self._batch: List[Tuple[str, bytes]] = []
+        self._lock = threading.Lock()
+        self._rate_lock = threading.Lock()
+        self._blocked_until = 0.0
+        self.errors: List[Exception] = []
+
+    def __enter__(self) -> WebhookPublisher:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _wait_rate_limit(self):
+        while True:
+            with self._rate_lock:
+                delay = self._blocked_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _block_for(self, seconds: float):
+        with self._rate_lock:
+            self._blocked_until = max(
+                self._blocked_until, time.monotonic() + seconds)
+
+    def _update_rate_limit(self, headers):
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if remaining is not None and reset_after is not None:
+            try:
+                if int(remaining) <= 0:
+                    self._block_for(float(reset_after))
+            except ValueError:
+                pass
+
+    @staticmethod
+    def _retry_after(e: urllib.error.HTTPError) -> float:
+        header = e.headers.get("Retry-After")
+        if header is not None:
+            try:
+                return float(header)
+            except ValueError:
+                pass
+        try:
+            return float(json.loads(e.read())["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return BACKOFF_BASE
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _send(self, payload: dict, files: List[Tuple[str, bytes]]):
+        if files:
+            payload = dict(payload)
+            payload["attachments"] = [
+                {"id": i, "filename": filename}
+                for i, (filename, _) in enumerate(files)
+            ]
+            body, content_type = _encode_multipart(payload, files)
+        else:
+            body = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_rate_limit()
+            req = urllib.request.Request(
+                self.url,
+                data=body,
+                headers={
+                    "Content-Type": content_type,
+                    "User-Agent": USER_AGENT,
+                },
+                method="POST",
+            )
+            try:
+                with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                    self._update_rate_limit(resp.headers)
+                    return
+            except urllib.error.HTTPError as e:
+                self._update_rate_limit(e.headers)
+                if e.code == 429:
+                    retry_after = self._retry_after(e)
+                    if e.headers.get("X-RateLimit-Global"):
+                        self._block_for(retry_after)
+                    else:
+                        time.sleep(retry_after)
+                    continue
+                if e.code < 500 or attempt >= self.max_retries:
+                    raise WebhookError(
+                        f"webhook request failed: {e.code} {e.reason}") from e
+            except (urllib.error.URLError, OSError) as e:
+                if attempt >= self.max_retries:
+                    raise WebhookError(
+                        f"webhook request failed: {repr(e)}") from e
+            time.sleep(self._backoff(attempt))
+
+        raise WebhookError("webhook request failed: retries exhausted")
+
+    def _send_sequence(self, messages: List[Message]):
+        for payload, files in messages:
+            self._send(payload, files)
+
+    def _submit(self, messages: List[Message]):
+        """Queue messages that are sent one after another in order
+        by a single worker.
+        """
+        fut = self._executor.submit(self._send_sequence, messages)
+        fut.add_done_callback(self._check_result)
+        self._futs.append(fut)
+
+    def _check_result(self, fut: Future):
+        e = fut.exception()
+        if e is not None:
+            print(f"error publishing to webhook: {e}", file=sys.stderr)
+            with self._lock:
+                self.errors.append(e)
+
+    def post_text(self, content: str, code_block: bool = False):
+        """Queue text message, split into multiple messages if needed.
+        The parts of a split message are sent in order.
+        """
+        limit = MAX_CONTENT_LENGTH - (8 if code_block else 0)
+        messages: List[Message] = []
+        for chunk in split_content(content, limit):
+            if code_block:
+                chunk = f"```\n{chunk}```"
+            messages.append(({"content": chunk}, []))
+        if messages:
+            self._submit(messages)
+
+    def post_image(self, filename: str, data: bytes):
+        """Queue image. Images are sent in batches of MAX_ATTACHMENTS."""
+        with self._lock:
+            self._batch.append((safe_filename(filename), data))
+            if len(self._batch) < MAX_ATTACHMENTS:
+                return
+            batch = self._batch
+            self._batch = []
+        self._submit([({}, batch)])
+
+    def flush(self):
+        """Send pending images without waiting for a full batch."""
+        with self._lock:
+            batch = self._batch
+            self._batch = []
+        if batch:
+            self._submit([({}, batch)])
+
+    def close(self) -> List[Exception]:
+        """Flush pending images, wait for all uploads to finish
+        and return errors that occurred during publishing.
+        """
+        self.flush()
+        wait(self._futs)
+        self._executor.shutdown(wait=True)
+        return self.errors